@@ -1,27 +1,154 @@
+import logging
 import os
-from openai import OpenAI
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
 
-base_path = os.path.dirname(os.path.realpath(__file__))
+from src.llm import LLMClient, get_client
+from src.prompt import VOLATILE_FIELDS, PromptBuilder
 
-client = OpenAI(
-    api_key="sk-c5ea9ba45f3f4fdbb55c2d6a32399a57",
-    base_url="https://api.deepseek.com",
-)
+base_path = os.path.dirname(os.path.realpath(__file__))
 
 async def send_messages(messages):
-    response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=messages,
-    )
-    print(response)
-    return response.choices[0].message
+    return await get_client().send_messages(messages)
+
+# 模板里出现这些占位符时才按 PromptBuilder 的格式解析，其余的 prompt 是原样使用的纯文本（可以含有 JSON 示例之类的花括号）
+TEMPLATE_FIELD = re.compile(r"\{(?:%s)\}" % "|".join(VOLATILE_FIELDS))
+
+
+class AgentTemplate:
+    """agents/<name>/prompt.txt 解析后的结果，PromptBuilder 在加载时就拆好了静态部分和上下文模板"""
+
+    def __init__(self, name: str, prompt_file: str):
+        self.name = name
+        self.prompt_file = prompt_file
+        with open(prompt_file, 'r', encoding='utf-8') as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime_ns
+            self.prompt = f.read()
+        self.builder = PromptBuilder(self.prompt) if TEMPLATE_FIELD.search(self.prompt) else None
+        self.checked_at = time.monotonic()
+
+class AgentRegistry:
+    """
+    启动时发现 agents/ 下的每个目录并加载其中的 prompt.txt。
+    get() 至多每 check_interval 秒 stat 一次文件，修改时间变了就重新加载；新文件有错时继续使用旧版本。
+    """
+
+    def __init__(self, root: str = os.path.join(base_path, 'agents'), check_interval: float = 1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self.templates: Dict[str, AgentTemplate] = {}
+        self.discover()
+
+    def prompt_file(self, name: str) -> str:
+        return os.path.join(self.root, name, 'prompt.txt')
+
+    def discover(self):
+        if not os.path.isdir(self.root):
+            logging.warning(f"No agents directory at {self.root}")
+            return
+        for name in sorted(os.listdir(self.root)):
+            if name not in self.templates and os.path.isfile(self.prompt_file(name)):
+                self.load(name)
+
+    def load(self, name: str) -> Optional[AgentTemplate]:
+        try:
+            template = AgentTemplate(name, self.prompt_file(name))
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            # 文件被删除或者模板写错了（例如花括号不配对）
+            logging.warning(f"Failed to load agent {name}: {e}")
+            return self.templates.get(name)
+        self.templates[name] = template
+        return template
+
+    def get(self, name: str) -> AgentTemplate:
+        template = self.templates.get(name)
+        if template is None:
+            # 运行中新增的 agent
+            template = self.load(name)
+            if template is None:
+                raise KeyError(f"unknown agent: {name}")
+            return template
+        now = time.monotonic()
+        if now - template.checked_at >= self.check_interval:
+            template.checked_at = now
+            try:
+                mtime = os.stat(template.prompt_file).st_mtime_ns
+            except OSError:
+                mtime = template.mtime
+            if mtime != template.mtime:
+                logging.info(f"Reloading agent {name}")
+                # 加载失败时记下这次的修改时间，文件再次修改之前不再重试
+                template.mtime = mtime
+                template = self.load(name)
+        return template
+
+    def names(self):
+        return list(self.templates)
 
 class Agent:
-    def __init__(self, name):
+    def __init__(self, name, registry: Optional[AgentRegistry] = None, client: Optional[LLMClient] = None):
         self.name = name
-        self.prompt_file = os.path.join(base_path, 'agents', name, 'prompt.txt')
-        self.prompt = self.get_prompt()
+        self.registry = registry or get_registry()
+        self.client = client or get_client()
+        self.prompt_file = self.registry.prompt_file(name)
+        self.registry.get(name)  # 未知的 agent 在构造时就报错
+
+    @property
+    def template(self) -> AgentTemplate:
+        return self.registry.get(self.name)
+
+    @property
+    def prompt(self):
+        return self.template.prompt
 
     def get_prompt(self):
-        with open(self.prompt_file, 'r') as f:
-            return f.read()
\ No newline at end of file
+        return self.template.prompt
+
+    def build(self, history, **values):
+        template = self.template
+        if template.builder is None:
+            return [{"role": "system", "content": template.prompt}, *history]
+        return template.builder.build(history, **values)
+
+    async def send_messages(self, messages):
+        response = await self.client.create(messages)
+        return response.choices[0].message
+
+class AgentPool:
+    """按名字复用 Agent 实例，所有实例共用一个 LLM 客户端和一个注册表"""
+
+    def __init__(self, registry: Optional[AgentRegistry] = None, client: Optional[LLMClient] = None, max_idle: int = 32):
+        self.registry = registry or get_registry()
+        self.client = client or get_client()
+        self.max_idle = max_idle
+        self.idle: Dict[str, deque] = {}
+
+    def acquire(self, name: str) -> Agent:
+        idle = self.idle.get(name)
+        if idle:
+            return idle.pop()
+        return Agent(name, self.registry, self.client)
+
+    def release(self, agent: Agent):
+        idle = self.idle.setdefault(agent.name, deque())
+        if len(idle) < self.max_idle:
+            idle.append(agent)
+
+    @contextmanager
+    def agent(self, name: str):
+        agent = self.acquire(name)
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+_registry: Optional[AgentRegistry] = None
+
+def get_registry() -> AgentRegistry:
+    global _registry
+    if _registry is None:
+        _registry = AgentRegistry()
+    return _registry
@@ -0,0 +1,29 @@
+"""
+运行全部基准测试：端到端链路（OneBot 替身 -> EventManager -> agent -> LLM 替身）和 MemoryManager 写入吞吐。
+参数与 benchmarks.pipeline 相同，另外可以指定记忆数量。
+
+    python -m benchmarks --messages 500 --rate 100 --memory-sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import logging
+
+from . import memory, pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    pipeline.add_arguments(parser)
+    parser.add_argument("--memory-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--memory-sample", type=int, default=1000)
+    parser.add_argument("--memory-batch-size", type=int, default=100)
+    args = parser.parse_args()
+    # 每轮对话的日志会淹没结果
+    logging.disable(logging.WARNING)
+
+    pipeline.report(asyncio.run(pipeline.run(args)))
+    memory.report(memory.run(args.memory_sizes, args.memory_sample, args.memory_batch_size), args.memory_batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+WebSocket 接收吞吐的基准测试。
+
+在本地起一个模拟 OneBot 的 WebSocket 服务器，按给定比例发送心跳和消息上报，
+测量 qqws.ingest 每秒能处理多少帧，并和逐帧 json.loads + add_event 的旧写法对比。
+
+    python -m benchmarks.ingest --frames 50000 --message-ratio 0.3
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import websockets
+
+from src import qqws
+from src.core import EventManager
+from src.models import Message, MessageEvent
+
+from .onebot import FrameFactory
+
+handled = 0
+
+
+@EventManager.register()
+async def count_message(event: MessageEvent):
+    global handled
+    handled += 1
+
+
+async def serve(frames: list, port: int) -> websockets.Server:
+    async def handler(websocket):
+        for frame in frames:
+            await websocket.send(frame)
+        await websocket.close()
+
+    return await websockets.serve(handler, "127.0.0.1", port, max_queue=None)
+
+
+async def naive_ingest(websocket):
+    """listen_message 原来的写法：每帧完整解码，逐个 await add_event"""
+    while True:
+        data = json.loads(await websocket.recv())
+        if data.get("post_type", "null") == "message":
+            await EventManager.add_event(MessageEvent.from_message(Message.from_dict(data)))
+
+
+async def run(mode: str, frames: list, expected: int, port: int, batch_size: int) -> float:
+    global handled
+    handled = 0
+    EventManager.configure(max_queue_size=10000, max_in_flight=1000)
+    consumer = asyncio.get_running_loop().create_task(EventManager.run_immediate())
+    server = await serve(frames, port)
+    start = time.perf_counter()
+    async with websockets.connect(f"ws://127.0.0.1:{port}/", max_queue=256) as websocket:
+        try:
+            if mode == "naive":
+                await naive_ingest(websocket)
+            else:
+                await qqws.ingest(websocket, batch_size=batch_size)
+        except websockets.ConnectionClosed:
+            pass
+    while handled < expected:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    consumer.cancel()
+    server.close()
+    await server.wait_closed()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--message-ratio", type=float, default=0.3)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+
+    frames = FrameFactory(heartbeat_ratio=1 - args.message_ratio, media_ratio=0).frames(args.frames)
+    expected = sum('"post_type": "message"' in frame for frame in frames)
+    print(f"{args.frames} frames, {expected} messages, orjson: {'yes' if qqws.orjson else 'no'}")
+    for mode in ("naive", "ingest"):
+        elapsed = await run(mode, frames, expected, args.port, args.batch_size)
+        print(f"{mode:>8}: {args.frames / elapsed:10.0f} frames/s  ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
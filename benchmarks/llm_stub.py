@@ -0,0 +1,133 @@
+"""
+OpenAI 兼容的 LLM 替身：实现 POST /chat/completions（流式和非流式），延迟和工具调用行为可配置，
+让 agent 的完整链路可以在没有网络、不花钱的情况下压测。
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Optional
+
+
+class StubLLMServer:
+    """
+    first_token_latency 是收到请求到第一个片段的时间，token_interval 是之后每个片段的间隔；
+    最后一条消息是用户输入时，以 tool_call_ratio 的概率先返回一个 save_memory 工具调用，
+    工具结果回来后再给出文本回复。
+    """
+
+    def __init__(
+        self,
+        first_token_latency: float = 0.2,
+        token_interval: float = 0.01,
+        reply_tokens: int = 24,
+        tool_call_ratio: float = 0.3,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.reply_tokens = reply_tokens
+        self.tool_call_ratio = tool_call_ratio
+        self.rng = random.Random(seed)
+        self.host = host
+        self.port = port
+        self.ids = itertools.count(1)
+        self.requests = 0
+        self.tool_calls = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 一个连接上可以有多个请求（客户端使用 keep-alive 连接池）
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).strip()
+                    if not line:
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self.respond(json.loads(body or b"{}"), writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def plan(self, request: dict) -> dict:
+        """
+        决定这次回复的内容：工具调用或者文本。
+        """
+        # 请求末尾可能还有放上下文的系统消息，看最后一条非系统消息
+        roles = [message.get("role") for message in request.get("messages", []) if message.get("role") != "system"]
+        last_role = roles[-1] if roles else "user"
+        if request.get("tools") and last_role == "user" and self.rng.random() < self.tool_call_ratio:
+            self.tool_calls += 1
+            arguments = json.dumps({"key": "benchmark.preference", "value": [f"number {self.rng.randrange(1000)}"]})
+            return {"tool_calls": [{"index": 0, "id": f"call_{next(self.ids)}", "type": "function", "function": {"name": "save_memory", "arguments": arguments}}]}
+        words = [f"word{i}" + ("." if i % 8 == 7 or i == self.reply_tokens - 1 else "") for i in range(self.reply_tokens)]
+        return {"content": " ".join(words)}
+
+    @staticmethod
+    def usage(request: dict, completion_tokens: int) -> dict:
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in request.get("messages", [])) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    async def respond(self, request: dict, writer: asyncio.StreamWriter):
+        self.requests += 1
+        plan = self.plan(request)
+        base = {"id": f"chatcmpl-{next(self.ids)}", "created": int(time.time()), "model": request.get("model", "stub")}
+        finish_reason = "tool_calls" if "tool_calls" in plan else "stop"
+        pieces = [{"tool_calls": plan["tool_calls"]}] if "tool_calls" in plan else [{"content": word + " "} for word in plan["content"].split(" ")]
+        usage = self.usage(request, len(pieces))
+        await asyncio.sleep(self.first_token_latency)
+
+        if not request.get("stream"):
+            message = {"role": "assistant", "content": plan.get("content")}
+            if "tool_calls" in plan:
+                message["tool_calls"] = [{key: value for key, value in call.items() if key != "index"} for call in plan["tool_calls"]]
+            body = json.dumps({
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            }).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n" + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        async def send(data):
+            payload = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+            writer.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            await writer.drain()
+
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            delta = {"role": "assistant", **piece} if i == 0 else piece
+            await send({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        await send({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        if request.get("stream_options", {}).get("include_usage"):
+            await send({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        await send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
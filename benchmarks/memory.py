@@ -0,0 +1,67 @@
+"""
+MemoryManager 写入吞吐：在 JSON 和 SQLite 两种后端中先放入 10^3、10^4、10^5 条记忆，
+再比较此时逐条落盘和用 batch() 合并落盘的写入速度。
+
+    python -m benchmarks.memory --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from src.agent import MemoryManager
+
+BACKENDS = {"json": "memories.json", "sqlite": "memories.db"}
+
+
+def write(memory_manager: MemoryManager, start: int, count: int, batch_size: int):
+    if batch_size <= 1:
+        for i in range(start, start + count):
+            memory_manager.save_memory(f"benchmark.group{i % 100}.key{i}", [f"value {i}"])
+        return
+    for offset in range(start, start + count, batch_size):
+        with memory_manager.batch():
+            for i in range(offset, min(offset + batch_size, start + count)):
+                memory_manager.save_memory(f"benchmark.group{i % 100}.key{i}", [f"value {i}"])
+
+
+def measure(backend: str, size: int, sample: int, batch_size: int) -> dict:
+    """
+    先用一个大 batch 写入 size 条记忆，再分别测量逐条写入和按 batch_size 合并写入 sample 条时每秒的条数。
+    """
+    workdir = tempfile.mkdtemp(prefix="deep-assistant-bench-")
+    memory_manager = MemoryManager(os.path.join(workdir, BACKENDS[backend]))
+    start = time.perf_counter()
+    write(memory_manager, 0, size, size)
+    fill = size / (time.perf_counter() - start)
+    rates = {}
+    for label, batch in (("single", 1), ("batched", batch_size)):
+        start = time.perf_counter()
+        write(memory_manager, size + len(rates) * sample, sample, batch)
+        memory_manager.flush()
+        rates[label] = sample / (time.perf_counter() - start)
+    memory_manager.close()
+    return {"backend": backend, "memories": size, "fill": fill, **rates}
+
+
+def run(sizes, sample: int = 1000, batch_size: int = 100) -> list:
+    return [measure(backend, size, sample, batch_size) for backend in BACKENDS for size in sizes]
+
+
+def report(results: list, batch_size: int = 100):
+    print(f"{'backend':>8} {'memories':>9} {'fill/s':>10} {'writes/s':>10} {f'batch={batch_size}':>10}")
+    for result in results:
+        print(f"{result['backend']:>8} {result['memories']:>9} {result['fill']:>10.0f} {result['single']:>10.0f} {result['batched']:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--sample", type=int, default=1000, help="writes timed at each size")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    report(run(args.sizes, args.sample, args.batch_size), args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+事件和消息对象的内存占用与构造耗时。
+
+按 qqws 的路径从 OneBot 上报的 dict 构造 Message 和 MessageEvent，用 tracemalloc 统计
+每个事件保留下来的字节数（含消息和片段），并分别测量 UUID 和整数 ID 下的构造时间。
+
+    python -m benchmarks.models --count 100000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from src import models
+from src.models import Message, MessageEvent
+
+
+def make_data(i: int) -> dict:
+    return {
+        "self_id": 10000, "user_id": 1000 + i % 200, "time": 1700000000 + i,
+        "message_id": i, "message_seq": i, "real_id": i, "message_type": "group",
+        "sender": {"user_id": 1000 + i % 200, "nickname": "bench", "card": ""},
+        "raw_message": f"hello {i}", "font": 14, "sub_type": "normal",
+        "message": [{"type": "text", "data": {"text": f"hello {i}"}}],
+        "message_format": "array", "post_type": "message", "group_id": 42,
+    }
+
+
+def build(frames: list) -> list:
+    return [MessageEvent.from_message(Message.from_dict(data)) for data in frames]
+
+
+def measure(count: int) -> tuple:
+    frames = [make_data(i) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = build(frames)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del events
+    gc.collect()
+
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        events = build(frames)
+        best = min(best, time.perf_counter() - start)
+        del events
+    return retained / count, best / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    variants = [("uuid4 ids", False)]
+    if hasattr(models, "use_integer_ids"):
+        variants.append(("integer ids", True))
+    for label, integer_ids in variants:
+        if hasattr(models, "use_integer_ids"):
+            models.use_integer_ids(integer_ids)
+        size, duration = measure(args.count)
+        print(f"{label:>12}: {size:7.0f} bytes/event  {duration:6.2f} us/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+本地的 OneBot WebSocket 替身：按给定速率和比例发送合成的上报帧（私聊 / 群聊、纯文本 / 带媒体、心跳），
+并接收 send_private_msg / send_group_msg 动作，统计回复。
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+EXTENSIONS = {"image": "jpg", "record": "amr", "file": "pdf"}
+
+
+class FrameFactory:
+    """
+    生成合成的 OneBot 上报帧，同一个 seed 生成的序列相同。
+    """
+
+    def __init__(
+        self,
+        group_ratio: float = 0.5,
+        media_ratio: float = 0.2,
+        heartbeat_ratio: float = 0.0,
+        users: int = 200,
+        groups: int = 20,
+        seed: int = 0,
+    ):
+        self.group_ratio = group_ratio
+        self.media_ratio = media_ratio
+        self.heartbeat_ratio = heartbeat_ratio
+        self.users = users
+        self.groups = groups
+        self.rng = random.Random(seed)
+        self.message_id = 0
+
+    def heartbeat(self) -> dict:
+        return {
+            "time": int(time.time()), "self_id": 10000, "post_type": "meta_event", "meta_event_type": "heartbeat",
+            "status": {"online": True, "good": True}, "interval": 30000,
+        }
+
+    def message(self) -> dict:
+        rng = self.rng
+        self.message_id += 1
+        user_id = rng.randrange(1, self.users + 1)
+        group = rng.random() < self.group_ratio
+        text = f"benchmark message {self.message_id}, please remember that I like number {rng.randrange(1000)}"
+        segments = [{"type": "text", "data": {"text": text}}]
+        raw_message = text
+        if rng.random() < self.media_ratio:
+            kind = rng.choice(("image", "record", "file"))
+            name = f"{rng.randrange(100):032X}.{EXTENSIONS[kind]}"  # 只有 100 种，模拟反复转发的同一张图
+            segments.append({"type": kind, "data": {"file": name, "url": f"http://127.0.0.1:9/{name}?rkey={self.message_id}"}})
+            raw_message += f"[CQ:{kind},file={name}]"
+        data = {
+            "self_id": 10000, "user_id": user_id, "time": int(time.time()),
+            "message_id": self.message_id, "message_seq": self.message_id, "real_id": self.message_id,
+            "message_type": "group" if group else "private",
+            "sender": {"user_id": user_id, "nickname": f"user{user_id}", "card": ""},
+            "raw_message": raw_message, "font": 14, "sub_type": "normal" if group else "friend",
+            "message": segments, "message_format": "array", "post_type": "message",
+        }
+        if group:
+            data["group_id"] = rng.randrange(1, self.groups + 1)
+        return data
+
+    def frame(self) -> dict:
+        if self.rng.random() < self.heartbeat_ratio:
+            return self.heartbeat()
+        return self.message()
+
+    def frames(self, count: int) -> List[str]:
+        return [json.dumps(self.frame(), ensure_ascii=False) for _ in range(count)]
+
+
+class OneBotServer:
+    """
+    连接建立后以 rate 帧每秒（0 为不限速）发送 count 帧。sent 记录每条消息的发送时刻，
+    replies 记录收到的回复动作；close_when_done 时发完就断开连接。
+    """
+
+    def __init__(self, factory: FrameFactory, count: int, rate: float = 0, close_when_done: bool = False, host: str = "127.0.0.1", port: int = 0):
+        self.factory = factory
+        self.count = count
+        self.rate = rate
+        self.close_when_done = close_when_done
+        self.host = host
+        self.port = port
+        self.sent: Dict[int, float] = {}  # message_id -> time.perf_counter() 的发送时刻
+        self.replies: List[dict] = []
+        self.done = asyncio.Event()
+        self.server: Optional[websockets.Server] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/"
+
+    async def start(self):
+        self.server = await websockets.serve(self.handle, self.host, self.port, max_queue=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, websocket):
+        receiver = asyncio.get_running_loop().create_task(self.receive(websocket))
+        try:
+            await self.send(websocket)
+            self.done.set()
+            if self.close_when_done:
+                await websocket.close()
+            else:
+                await websocket.wait_closed()
+        finally:
+            receiver.cancel()
+
+    async def send(self, websocket):
+        start = time.perf_counter()
+        for i in range(self.count):
+            if self.rate > 0:
+                delay = start + i / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            data = self.factory.frame()
+            if data["post_type"] == "message":
+                self.sent[data["message_id"]] = time.perf_counter()
+            await websocket.send(json.dumps(data, ensure_ascii=False))
+
+    async def receive(self, websocket):
+        async for frame in websocket:
+            action = json.loads(frame)
+            if action.get("action") in ("send_private_msg", "send_group_msg"):
+                self.replies.append(action)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
@@ -0,0 +1,154 @@
+"""
+端到端基准测试：OneBot 替身 -> qqws.listen_message -> EventManager -> AgentRuntime -> LLM 替身 -> 回复。
+
+报告消息吞吐、从替身发出消息到处理函数完成一轮对话的 p50 / p99 延迟，以及进程的 RSS。
+
+    python -m benchmarks.pipeline --messages 500 --rate 100 --llm-latency 0.2 --tool-call-ratio 0.3
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+from typing import List
+
+from src import qqws
+from src.core import EventManager
+from src.llm import LLMClient, get_client, set_client
+from src.models import MessageEvent, PartialReplyEvent
+from src.runtime import AgentRuntime
+from src.storage import open_storage
+
+from .llm_stub import StubLLMServer
+from .onebot import FrameFactory, OneBotServer
+
+
+def rss_mb() -> float:
+    """
+    当前常驻内存（MB），不支持 /proc 的系统上退回到峰值。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 2**10
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="deep-assistant-bench-")
+    onebot = OneBotServer(
+        FrameFactory(args.group_ratio, args.media_ratio, args.heartbeat_ratio, args.users, args.groups, args.seed),
+        args.messages,
+        args.rate,
+    )
+    llm = StubLLMServer(args.llm_latency, args.token_interval, args.reply_tokens, args.tool_call_ratio, args.seed)
+    await onebot.start()
+    await llm.start()
+    set_client(LLMClient(api_key="benchmark", base_url=llm.base_url, max_concurrency=args.llm_concurrency))
+    EventManager.configure(max_queue_size=args.messages, max_in_flight=args.max_in_flight)
+    runtime = AgentRuntime(open_storage(os.path.join(workdir, "memories.db")), sessions_dir=os.path.join(workdir, "sessions"))
+
+    latencies = []
+    handled = asyncio.Event()
+    expected = round(args.messages * (1 - args.heartbeat_ratio))
+
+    @EventManager.register()
+    async def handle_message(event: MessageEvent):
+        event.message.segments  # 和真实的处理函数一样解析片段
+        await runtime.handle(event)
+        latencies.append(time.perf_counter() - onebot.sent[event.message.message_id])
+        if len(latencies) >= expected:
+            handled.set()
+
+    @EventManager.register()
+    async def send_reply(event: PartialReplyEvent):
+        await qqws.send_text(event.reply_to, event.text)
+
+    rss_before = rss_mb()
+    await EventManager.run()
+    listener = asyncio.get_running_loop().create_task(qqws.listen_message(onebot.url))
+    start = time.perf_counter()
+    await onebot.done.wait()
+    # 速率和比例是随机的，实际发出的消息数以替身记录为准
+    if len(latencies) < len(onebot.sent):
+        expected = len(onebot.sent)
+        try:
+            await asyncio.wait_for(handled.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            pass
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "messages": len(onebot.sent),
+        "handled": len(latencies),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "replies": len(onebot.replies),
+        "llm_requests": llm.requests,
+        "tool_calls": llm.tool_calls,
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": rss_mb() - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    listener.cancel()
+    await EventManager.shutdown(timeout=5)
+    await runtime.close()
+    await get_client().close()
+    await onebot.stop()
+    await llm.stop()
+    return result
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--messages", type=int, default=500, help="frames sent by the OneBot stand-in")
+    parser.add_argument("--rate", type=float, default=100, help="frames per second, 0 for as fast as possible")
+    parser.add_argument("--group-ratio", type=float, default=0.5)
+    parser.add_argument("--media-ratio", type=float, default=0.2)
+    parser.add_argument("--heartbeat-ratio", type=float, default=0.0)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds before the first streamed token")
+    parser.add_argument("--token-interval", type=float, default=0.005)
+    parser.add_argument("--reply-tokens", type=int, default=24)
+    parser.add_argument("--tool-call-ratio", type=float, default=0.3)
+    parser.add_argument("--llm-concurrency", type=int, default=64)
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def report(result: dict):
+    print(
+        f"pipeline: {result['handled']}/{result['messages']} messages in {result['seconds']:.2f}s "
+        f"({result['throughput']:.1f} msg/s), p50 {result['p50'] * 1000:.0f} ms, p99 {result['p99'] * 1000:.0f} ms"
+    )
+    print(
+        f"          {result['replies']} reply pieces, {result['llm_requests']} LLM requests ({result['tool_calls']} tool calls), "
+        f"RSS {result['rss_mb']:.0f} MB (+{result['rss_growth_mb']:.0f} MB, peak {result['peak_rss_mb']:.0f} MB)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    report(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
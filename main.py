@@ -1,13 +1,59 @@
+import argparse
 import asyncio
 from src.core import EventManager
-from src.models import MessageEvent
-from src.qqws import listen_message
+from src.download import Downloader, media_downloads
+from src.journal import open_journal, replay
+from src.metrics import JsonLinesExporter, PrometheusExporter, add_exporter
+from src.models import DownloadEvent, MessageEvent, PartialReplyEvent
+from src.qqws import listen_message, send_text
+from src.runtime import AgentRuntime
+
+runtime = AgentRuntime()
+downloader = Downloader()
+EventManager.register(DownloadEvent)(downloader.handle)
 
 @EventManager.register()
 async def handle_message(event: MessageEvent):
     print(event.message)
+    await EventManager.add_events(media_downloads(event.message))
+    await runtime.handle(event)
+
+@EventManager.register()
+async def send_reply(event: PartialReplyEvent):
+    await send_text(event.reply_to, event.text)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--journal", help="append events to this journal and re-run the ones a previous run left unfinished")
+parser.add_argument("--replay", help="feed the events recorded in a journal instead of connecting to QQ")
+parser.add_argument("--replay-speed", type=float, default=1.0, help="0 replays as fast as possible")
+parser.add_argument("--metrics-log", help="append a JSON line per conversation turn to this file")
+parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+parser.add_argument("--metrics-host", default="127.0.0.1")
+args = parser.parse_args()
 
 loop = asyncio.get_event_loop()
-loop.create_task(listen_message())
+metrics_log = prometheus = None
+if args.metrics_log:
+    metrics_log = JsonLinesExporter(args.metrics_log)
+    add_exporter(metrics_log)
+if args.metrics_port:
+    prometheus = PrometheusExporter(args.metrics_host, args.metrics_port)
+    add_exporter(prometheus)
+    loop.run_until_complete(prometheus.start())
+if args.journal:
+    loop.run_until_complete(open_journal(args.journal))
+if args.replay:
+    loop.create_task(replay(args.replay, args.replay_speed))
+else:
+    loop.create_task(listen_message())
 loop.create_task(EventManager.run())
-loop.run_forever()
\ No newline at end of file
+try:
+    loop.run_forever()
+finally:
+    loop.run_until_complete(EventManager.shutdown(timeout=5))
+    loop.run_until_complete(runtime.close())
+    loop.run_until_complete(downloader.close())
+    if prometheus is not None:
+        loop.run_until_complete(prometheus.stop())
+    if metrics_log is not None:
+        metrics_log.close()
@@ -1,226 +1,306 @@
+import asyncio
 import json
 import logging
-from openai import OpenAI
+import os
+import time
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Dict, Optional, List, Set, Union
+from typing import Awaitable, Callable, Dict, Optional, List, Union
+from .core import EventManager
+from .history import ConversationHistory
+from .llm import get_client
+from .metrics import Turn
+from .models import Message, PartialReplyEvent
+from .prompt import PromptBuilder
+from .retrieval import MemoryIndex, fit_budget, render_memory, render_tree
+from .storage import Memory, MemoryStorage, open_storage
+from .tools import registry as tool_registry
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# 初始化 OpenAI 客户端
-client = OpenAI(
-    api_key="sk-c5ea9ba45f3f4fdbb55c2d6a32399a57",
-    base_url="https://api.deepseek.com",
-)
-
-def send_messages(messages, tools={}):
+async def send_messages(messages, tools=None):
     """
     发送消息到 LLM 并获取响应。
     """
-    response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=messages,
-        tools=tools
-    )
-    return response.choices[0].message
+    return await get_client().send_messages(messages, tools=tools)
 
 
-class Memory:
-    def __init__(self, key: str, value: Set[Union[str, dict, list, tuple]], created_at: Optional[str] = None, modified_at: Optional[str] = None):
-        """
-        初始化记忆对象。
-        """
-        self.key = key
-        self.value = value
-        self.created_at = created_at or datetime.now().isoformat()
-        self.modified_at = modified_at or datetime.now().isoformat()
+async def stream_messages(
+    messages,
+    tools=None,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+    turn: Optional[Turn] = None,
+    cache_messages: Optional[list] = None,
+):
+    """
+    以流式模式发送消息，每生成完一句就调用一次 on_text，返回拼装好的完整响应（包括 tool_calls）。
+    传入 turn 时记录这次 LLM 调用的耗时、第一段输出的延迟和 token 用量；cache_messages 见 LLMClient.lookup。
+    """
+    with turn.span("llm") if turn is not None else nullcontext() as span:
+        stream = await get_client().stream(messages, tools=tools, cache_messages=cache_messages)
+        async for text in (stream.sentences() if on_text is not None else stream):
+            if span is not None and "first_output" not in span.attributes:
+                span.attributes["first_output"] = time.perf_counter() - span.start
+            if on_text is not None:
+                await on_text(text)
+    if turn is not None:
+        turn.add_usage(stream.usage)
+    return stream.message
 
-    def to_dict(self):
-        """
-        将记忆对象转换为字典格式。
-        """
-        return {
-            "key": self.key,
-            "value": list(self.value),
-            "created_at": self.created_at,
-            "modified_at": self.modified_at
-        }
+
+def reply_publisher(reply_to: Optional[Message] = None) -> Callable[[str], Awaitable[None]]:
+    """
+    创建一个 on_text 回调，把每一句回复作为 PartialReplyEvent 发布到 EventManager，供 QQ 端先行发送。
+    """
+    index = 0
+
+    async def publish(text: str):
+        nonlocal index
+        await EventManager.add_event(PartialReplyEvent(text, index, reply_to=reply_to))
+        index += 1
+
+    return publish
 
 
 class MemoryManager:
-    def __init__(self, file_path: str = "memories.json"):
+    def __init__(self, file_path: str = "memories.json", storage: Optional[MemoryStorage] = None, **storage_options):
         """
         初始化记忆管理器。
+
+        storage 为空时按 file_path 的扩展名打开存储后端（见 open_storage），storage_options 会传给后端。
         """
         self.file_path = file_path
-        self.memories: Dict[str, Memory] = {}
-        self.load_memories()
+        self.storage = storage if storage is not None else open_storage(file_path, **storage_options)
+        self.index: Optional[MemoryIndex] = None  # 第一次检索时才建立，之后随修改增量更新
+        self.version = 0  # 每次修改加一，用来判断渲染缓存是否过期
+        self.rendered: Dict[tuple, str] = {}  # (version, 选中的 key, 渲染参数) -> 渲染结果
 
     def save_memory(self, key: str, value: List[Union[str, dict, list, tuple]], override: bool = False):
         """
         保存记忆。如果 override 为 True，则覆盖原有值；否则将新值追加到列表中。
         """
         if not isinstance(value, list):
-            value = [value]  # 确保 value 是列表
+            value = [value]  # 直接调用时允许传单个值；经由 save_memory 工具调用时参数校验已经要求是列表
         value = set(value)  # 使用集合去重
-        if key in self.memories and not override:
+        memory = self.storage.get(key)
+        if memory is not None and not override:
             # 如果 key 已存在且不覆盖，则将新值追加到列表中
-            self.memories[key].value.update(value)
-            self.memories[key].modified_at = datetime.now().isoformat()
+            memory.value.update(value)
+            memory.modified_at = datetime.now().isoformat()
             status_message = f"successfully updated memory with key '{key}' by appending new value(s)."
         else:
             # 如果 key 不存在或需要覆盖，则创建或覆盖记忆
-            self.memories[key] = Memory(key, value)
+            memory = Memory(key, value)
             status_message = f"successfully added memory with key '{key}' and value '{value}'."
-        self.save_memories()
+        self.storage.put(memory)
+        self.version += 1
+        if self.index is not None:
+            self.index.add(memory)
         return {"status": status_message}
 
     def delete_memory(self, key: str):
         """
         删除记忆。
         """
-        if key in self.memories:
-            del self.memories[key]
-            self.save_memories()
+        if self.storage.delete(key):
+            self.version += 1
+            if self.index is not None:
+                self.index.remove(key)
             return {"status": f"successfully deleted memory with key '{key}'."}
         else:
             return {"status": "error", "message": f"Memory with key '{key}' does not exist."}
 
-    def get_summary(self) -> Dict:
+    def get_memory(self, key: str) -> Optional[Memory]:
+        return self.storage.get(key)
+
+    def get_prefix(self, prefix: str) -> List[Memory]:
+        """
+        获取 prefix 命名空间下的全部记忆，例如 get_prefix("user.preferences")。
+        """
+        return list(self.storage.with_prefix(prefix))
+
+    def delete_prefix(self, prefix: str):
+        """
+        删除整个命名空间下的记忆。
+        """
+        keys = self.storage.delete_prefix(prefix)
+        self.version += 1
+        if self.index is not None:
+            for key in keys:
+                self.index.remove(key)
+        return {"status": f"successfully deleted {len(keys)} memories under '{prefix}'."}
+
+    @staticmethod
+    def render(memories: List[Memory], compact: bool = False, timestamps: bool = True):
+        """
+        compact 为 True 时按命名空间嵌套渲染（见 render_tree），否则逐条列出。
+        """
+        if compact:
+            return render_tree(memories, timestamps=timestamps)
+        if timestamps:
+            return [memory.to_dict() for memory in memories]
+        return [render_memory(memory) for memory in memories]
+
+    def get_summary(self, compact: bool = False, timestamps: bool = True) -> Dict:
         """
         获取记忆概览信息，列出所有记忆。
         """
         return {
-            "total_memories": len(self.memories),
-            "all_memories": [memory.to_dict() for memory in self.memories.values()]
+            "total_memories": len(self.storage),
+            "all_memories": self.render(list(self.storage.values()), compact, timestamps)
         }
 
-    def save_memories(self):
-        """
-        将记忆保存到本地文件。
-        """
-        memories_data = {key: memory.to_dict() for key, memory in self.memories.items()}
-        with open(self.file_path, "w", encoding='utf-8') as file:
-            json.dump(memories_data, file, indent=4, ensure_ascii=False)
-        logging.info(f"Memories saved to {self.file_path}")
-
-    def load_memories(self):
-        """
-        从本地文件加载记忆。
-        """
-        try:
-            with open(self.file_path, "r", encoding='utf-8') as file:
-                memories_data = json.load(file)
-                for key, data in memories_data.items():
-                    self.memories[key] = Memory(
-                        key=data["key"],
-                        value=data["value"],
-                        created_at=data.get("created_at"),
-                        modified_at=data.get("modified_at")
-                    )
-            logging.info(f"Memories loaded from {self.file_path}")
-        except FileNotFoundError:
-            logging.warning(f"No memory file found at {self.file_path}. Starting with an empty memory manager.")
-
-
-# 定义工具函数
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "save_memory",
-            "description": "Save a memory to the memory manager. If the key already exists, the new value will be appended to the list unless override is set to True.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "key": {
-                        "type": "string",
-                        "description": "The key associated with the memory (always in English)."
-                    },
-                    "value": {
-                        "type": "array",
-                        "items": {
-                            "type": ["string", "object", "array"]
-                        },
-                        "description": "The value(s) to store in memory. Must be a list, even if it contains only one element."
-                    },
-                    "override": {
-                        "type": "boolean",
-                        "description": "If True, overwrite the existing value. If False, append the new value to the list.",
-                        "default": False
-                    }
-                },
-                "required": ["key", "value"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "delete_memory",
-            "description": "Delete a memory from the memory manager.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "key": {
-                        "type": "string",
-                        "description": "The key associated with the memory."
-                    }
-                },
-                "required": ["key"]
-            }
+    def select_relevant(self, query: str, top_k: int = 20, token_budget: int = 1500) -> List[Memory]:
+        """
+        检索与 query 最相关的 top_k 条记忆，并裁剪到 token_budget 以内。
+        """
+        if self.index is None:
+            self.index = MemoryIndex()
+            for memory in self.storage.values():
+                self.index.add(memory)
+        ranked = (self.storage.get(key) for key, _ in self.index.search(query, top_k))
+        return fit_budget((memory for memory in ranked if memory is not None), token_budget)
+
+    def get_relevant(self, query: str, top_k: int = 20, token_budget: int = 1500, compact: bool = True, timestamps: bool = False) -> Dict:
+        """
+        获取与 query 相关的记忆概览，代替把全部记忆塞进提示词。
+        """
+        return {
+            "total_memories": len(self.storage),
+            "relevant_memories": self.render(self.select_relevant(query, top_k, token_budget), compact, timestamps)
         }
-    }
-]
 
-# 多轮对话
-def chat():
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant that can manage memories. You need to actively add useful memories, especially about the user, to be more helpful."},
-    ]
-    while True:
-        user_input = input("You: ")
-        if user_input.lower() in ["exit", "quit"]:
-            break
-        
-        user_input = "Please remember new information about me if needed. If you remember anything, don't tell me what you just remember, just reply me." + user_input
-        # 更新 messages[0] 为当前记忆概览
-        memory_summary = memory_manager.get_summary()
-        current_time = datetime.now().isoformat()
-        messages[0] = {"role": "system", "content": prompt.format(current_time=current_time, memory_summary=json.dumps(memory_summary, indent=4, ensure_ascii=False))}
+    def render_block(self, query: str, top_k: int = 20, token_budget: int = 1500, compact: bool = True, timestamps: bool = False) -> str:
+        """
+        渲染注入提示词的记忆块。记忆没有变化且选中的条目相同时直接复用上次的结果，不再重新序列化。
+        """
+        selected = self.select_relevant(query, top_k, token_budget)
+        cache_key = (self.version, tuple(memory.key for memory in selected), compact, timestamps)
+        block = self.rendered.get(cache_key)
+        if block is None:
+            summary = {"total_memories": len(self.storage), "relevant_memories": self.render(selected, compact, timestamps)}
+            block = json.dumps(summary, ensure_ascii=False, separators=(",", ":"))
+            # 旧版本的渲染结果不会再被用到
+            self.rendered = {key: value for key, value in self.rendered.items() if key[0] == self.version}
+            self.rendered[cache_key] = block
+        return block
+
+    def batch(self):
+        """
+        合并 with 块内的多次修改，退出时统一落盘，例如把一轮 LLM 的多个工具调用合并成一次 fsync。
+        """
+        return self.storage.batch()
+
+    def flush(self):
+        self.storage.flush()
+
+    def close(self):
+        self.storage.close()
+
+
+async def execute_tool_call(tool_call, memory_manager: MemoryManager, turn: Optional[Turn] = None) -> dict:
+    """
+    执行一个工具调用，返回对应的 tool 消息。
+    """
+    function_name = tool_call.function.name
+    with turn.span("tool", tool=function_name) if turn is not None else nullcontext():
+        tool_result = await tool_registry.call(function_name, tool_call.function.arguments, memory_manager=memory_manager)
+    return {"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(tool_result, ensure_ascii=False)}
+
+
+async def execute_tool_calls(tool_calls, memory_manager: MemoryManager, turn: Optional[Turn] = None) -> List[dict]:
+    """
+    并发执行同一轮的全部工具调用，按原顺序返回 tool 消息；记忆的修改在最后统一落盘一次。
+    """
+    with memory_manager.batch():
+        tool_messages = await asyncio.gather(*(execute_tool_call(tool_call, memory_manager, turn) for tool_call in tool_calls))
+        with turn.span("memory_save") if turn is not None else nullcontext():
+            memory_manager.flush()
+    return list(tool_messages)
+
 
-        # 添加用户输入到消息历史
-        messages.append({"role": "user", "content": user_input})
+PROMPT_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "agents", "uniform.txt")
 
-        # 发送消息并获取响应
-        response = send_messages(messages, tools=tools)
+
+def load_prompt_builder(prompt_file: str = PROMPT_FILE) -> PromptBuilder:
+    with open(prompt_file, "r", encoding='utf-8') as file:
+        return PromptBuilder(file.read())
+
+
+async def run_turn(
+    user_input: str,
+    memory_manager: MemoryManager,
+    prompt_builder: PromptBuilder,
+    history: ConversationHistory,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+    **turn_attributes,
+):
+    """
+    处理一轮对话：检索记忆、调用 LLM、执行工具调用直到得到最终回复，返回最终的响应消息。
+    """
+    # 本轮上下文：当前时间和与输入最相关的记忆（用原始输入检索），放在请求末尾
+    context = {
+        "current_time": datetime.now().isoformat(timespec="seconds"),
+        "memory_summary": memory_manager.render_block(user_input),
+    }
+    user_input = "Please remember new information about me if needed. If you remember anything, don't tell me what you just remember, just reply me." + user_input
+
+    # 添加用户输入到消息历史
+    history.append({"role": "user", "content": user_input})
+
+    # 出错时 Turn 同样会结束并导出这一轮的记录（带上 error）
+    with Turn(**turn_attributes) as turn:
+        # 流式发送消息，边生成边输出
+        response = await stream_messages(
+            prompt_builder.build(history.to_messages(), **context),
+            tools=tool_registry.schemas(),
+            on_text=on_text,
+            turn=turn,
+            cache_messages=prompt_builder.cache_messages(history.to_messages(), **context),
+        )
 
         # 处理 LLM 的工具调用
         while response.tool_calls:
-            messages.append(response)
-            for tool_call in response.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-
-                logging.warning(f"Calling function: {function_name} with args: {function_args}")
-
-                try:
-                    if function_name == "save_memory":
-                        tool_result = memory_manager.save_memory(**function_args)
-                    elif function_name == "delete_memory":
-                        tool_result = memory_manager.delete_memory(**function_args)
-                    else:
-                        tool_result = {"status": "error", "message": f"Unknown function: {function_name}"}
-                except Exception as e:
-                    tool_result = {"status": "error", "message": str(e)}
-
-                # 将工具调用结果添加到消息历史
-                messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": json.dumps(tool_result, ensure_ascii=False)})
+            turn.tool_rounds += 1
+            history.append(response)
+            # 同一轮的多个工具调用并发执行，结果按原顺序加入历史
+            for tool_message in await execute_tool_calls(response.tool_calls, memory_manager, turn):
+                history.append(tool_message)
 
             # 再次调用 LLM 以处理工具结果
-            response = send_messages(messages, tools=tools)
+            response = await stream_messages(
+                prompt_builder.build(history.to_messages(), **context),
+                tools=tool_registry.schemas(),
+                on_text=on_text,
+                turn=turn,
+                cache_messages=prompt_builder.cache_messages(history.to_messages(), **context),
+            )
 
         # 添加 LLM 响应到消息历史
-        if response.content:
-            print(f"Assistant: {response.content}")
-        messages.append(response)
\ No newline at end of file
+        history.append(response)
+    return response
+
+
+# 多轮对话
+async def chat(memory_manager: Optional[MemoryManager] = None, prompt_builder: Optional[PromptBuilder] = None, history: Optional[ConversationHistory] = None):
+    memory_manager = memory_manager or MemoryManager()
+    prompt_builder = prompt_builder or load_prompt_builder()
+    # 只保存用户、助手和工具消息，超出 token 预算的旧轮次会被折叠进摘要；
+    # 系统提示和本轮上下文在每次请求时由 prompt_builder 拼上
+    # ConversationHistory 定义了 __len__，调用方传入的空历史也是假值，不能用 or
+    if history is None:
+        history = ConversationHistory()
+
+    async def print_text(text: str):
+        print(text, end="", flush=True)
+
+    while True:
+        user_input = await asyncio.to_thread(input, "You: ")
+        if user_input.lower() in ["exit", "quit"]:
+            await history.wait()
+            break
+
+        print("Assistant: ", end="", flush=True)
+        await run_turn(user_input, memory_manager, prompt_builder, history, on_text=print_text)
+        print()
@@ -1,54 +1,647 @@
 import asyncio
-from typing import Type, Optional
+import collections
+import concurrent.futures
+import contextvars
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from typing import Hashable, Iterable, Type, Optional
 from .models import Event, EventStatus
 
 loop = asyncio.get_event_loop()
 
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+EXECUTORS = ("loop", "thread", "process")
+
+# set while a handler runs, events it adds must not wait for queue room (see EventManager.add_event)
+in_handler = contextvars.ContextVar("in_handler", default=False)
+# inside a thread handler, the loop that dispatched it; the queues belong to that loop (see EventManager.add_event)
+handler_loop = contextvars.ContextVar("handler_loop", default=None)
+
+
+class SpillFile:
+    """FIFO of pickled events on disk, used when a bounded queue overflows"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.read_pos = 0
+
+    def push(self, item):
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        # the first item starts a new file, whatever a crashed process with the same pid left behind
+        with open(self.path, "ab" if self.count else "wb") as f:
+            f.write(len(data).to_bytes(4, "big"))
+            f.write(data)
+        self.count += 1
+
+    def pop(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.read_pos)
+            size = int.from_bytes(f.read(4), "big")
+            data = f.read(size)
+            self.read_pos = f.tell()
+        self.count -= 1
+        if self.count == 0:
+            # everything has been read back, start over with an empty file
+            os.remove(self.path)
+            self.read_pos = 0
+        return pickle.loads(data)
+
+    def __len__(self):
+        return self.count
+
+
+class EventQueue:
+    """Bounded event queue with an overflow policy and basic counters
+
+    - block: ``put`` waits until there is room, which pushes back on the producer
+    - drop_oldest: the oldest queued event is discarded to make room
+    - spill: overflowing events are written to disk and read back in order
+
+    ``put(event, block=False)`` never waits: under the block policy an event
+    that finds the queue full is held in memory and moved into the queue ahead
+    of waiting producers as room frees up.
+    """
+
+    def __init__(self, name: str, maxsize: int = 0, overflow: str = "block", spill_dir: Optional[str] = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue = asyncio.Queue(maxsize)
+        self.spill = None
+        self.overflowed = collections.deque() # non-blocking puts that found the queue full
+        if overflow == "spill":
+            self.spill = SpillFile(os.path.join(spill_dir or tempfile.gettempdir(), f"deep-assistant-{name}-{os.getpid()}.spill"))
+        self.put_count = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.blocked_time = 0.0 # total time producers spent waiting for room
+        self.wait_time = 0.0 # total time events spent queued before being taken
+
+    async def put(self, event: Event, block: bool = True) -> Optional[Event]:
+        """Queue an event, returns the event dropped to make room for it under drop_oldest"""
+        self.put_count += 1
+        item = (time.monotonic(), event)
+        dropped = None
+        if self.spill is not None and (self.spill or self.queue.full()):
+            # keep FIFO order: once something is on disk, newer events go there too
+            self.spill.push(item)
+            self.spilled += 1
+            return None
+        if self.overflow == "drop_oldest" and self.queue.full():
+            _, dropped = self.queue.get_nowait()
+            self.dropped += 1
+        if self.queue.full() and not block:
+            self.overflowed.append(item)
+        elif self.queue.full():
+            start = time.monotonic()
+            await self.queue.put(item)
+            self.blocked_time += time.monotonic() - start
+        else:
+            self.queue.put_nowait(item)
+        return dropped
+
+    async def get(self) -> Event:
+        queued_at, event = await self.queue.get()
+        if self.overflowed:
+            self.queue.put_nowait(self.overflowed.popleft())
+        elif self.spill:
+            self.queue.put_nowait(self.spill.pop())
+        self.wait_time += time.monotonic() - queued_at
+        return event
+
+    def qsize(self) -> int:
+        return self.queue.qsize() + len(self.overflowed) + (len(self.spill) if self.spill is not None else 0)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "blocked_time": self.blocked_time,
+            "wait_time": self.wait_time,
+        }
+
+
+class DelayedQueue:
+    """Events ordered by the time they become due, backed by a heap
+
+    ``get`` sleeps on a single timer until the earliest deadline, or until a
+    put brings in an earlier one. The spill policy makes no sense for a
+    deadline-ordered queue, so it behaves like block here.
+    """
+
+    def __init__(self, name: str, maxsize: int = 0, overflow: str = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.heap = [] # (deadline, seq, event), deadline on the monotonic clock
+        self.counter = itertools.count()
+        self.changed = asyncio.Event() # set when the earliest deadline may have moved
+        self.not_full = asyncio.Event()
+        self.put_count = 0
+        self.dropped = 0
+        self.blocked_time = 0.0
+        self.wait_time = 0.0 # total time events stayed queued after they were due
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self.heap)
+
+    async def put(self, event: Event, not_before: float, block: bool = True) -> Optional[Event]:
+        """Queue an event that must not run before ``not_before`` (a time.time() timestamp)
+
+        With ``block=False`` a full queue is allowed to grow past maxsize instead of waiting.
+        Returns the event dropped to make room for it under drop_oldest.
+        """
+        self.put_count += 1
+        dropped = None
+        if self.full() and (block or self.overflow == "drop_oldest"):
+            if self.overflow == "drop_oldest":
+                oldest = min(range(len(self.heap)), key=lambda i: self.heap[i][1])
+                dropped = self.heap[oldest][2]
+                self.heap[oldest] = self.heap[-1]
+                self.heap.pop()
+                heapq.heapify(self.heap)
+                self.dropped += 1
+            else:
+                start = time.monotonic()
+                while self.full():
+                    self.not_full.clear()
+                    await self.not_full.wait()
+                self.blocked_time += time.monotonic() - start
+        deadline = time.monotonic() + (not_before - time.time())
+        entry = (deadline, next(self.counter), event)
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.changed.set()
+        return dropped
+
+    async def get(self) -> Event:
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = self.heap[0][0] - time.monotonic()
+                if timeout <= 0:
+                    deadline, _, event = heapq.heappop(self.heap)
+                    self.not_full.set()
+                    self.wait_time -= timeout
+                    return event
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def qsize(self) -> int:
+        return len(self.heap)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "blocked_time": self.blocked_time,
+            "wait_time": self.wait_time,
+            "next_due": self.heap[0][0] - time.monotonic() if self.heap else None,
+        }
+
+
+def call_handler(func, event: Event, dispatch_loop: Optional[asyncio.AbstractEventLoop] = None):
+    """Run a handler outside the event loop, coroutine handlers get a loop of their own"""
+    token = handler_loop.set(dispatch_loop)
+    try:
+        result = func(event)
+        if asyncio.iscoroutine(result):
+            result = asyncio.run(result)
+        return result
+    finally:
+        handler_loop.reset(token)
+
+
+def call_handler_in_process(func, event: Event):
+    """Process pool entry point, also sends the status back since the event itself is a copy"""
+    return call_handler(func, event), event.status
+
+
+class Handler:
+    """A registered event handler and its dispatch options"""
+
+    def __init__(self, event_type: Type[Event], func, priority: int = 0, max_concurrency: int = 0, executor: str = "loop"):
+        if executor not in EXECUTORS:
+            raise ValueError(f"unknown executor: {executor}")
+        self.event_type = event_type
+        self.func = func
+        self.priority = priority
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.in_flight = 0
+        self.calls = 0
+
+    async def __call__(self, event: Event):
+        self.calls += 1
+        if self.semaphore is None:
+            return await self.invoke(event)
+        async with self.semaphore:
+            return await self.invoke(event)
+
+    async def invoke(self, event: Event):
+        self.in_flight += 1
+        try:
+            if self.executor == "loop":
+                return await self.func(event)
+            running_loop = asyncio.get_running_loop()
+            if self.executor == "thread":
+                return await running_loop.run_in_executor(EventManager.get_pool("thread"), call_handler, self.func, event, running_loop)
+            # the handler sees a pickled copy of the event, only its status is carried back
+            result, event.status = await running_loop.run_in_executor(
+                EventManager.get_pool("process"), call_handler_in_process, self.func, event
+            )
+            return result
+        finally:
+            self.in_flight -= 1
+
+
+class Lane:
+    """Events sharing a partition key, handled one at a time in arrival order
+
+    ``pending`` holds the events waiting in memory behind the one being
+    handled, so a busy key does not take in_flight slots from other keys.
+    ``maxsize`` is the backlog EventManager.spawn lets a lane keep before the
+    overflow policy applies; under the spill policy the rest goes to a spill
+    file of this lane and is read back in order as it drains.
+    """
+
+    spill_ids = itertools.count()
+
+    def __init__(self, key: Hashable, maxsize: int = 0, spill_dir: Optional[str] = None):
+        self.key = key
+        self.maxsize = maxsize
+        self.spill_dir = spill_dir
+        self.pending = collections.deque()
+        self.spill: Optional[SpillFile] = None # created when the lane first overflows
+        self.task: Optional[asyncio.Task] = None
+        self.active = False # an event of this lane holds an in_flight slot
+        self.handled = 0
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self.pending)
+
+    def push_spill(self, event: Event):
+        """Write an event behind everything else in this lane to its spill file"""
+        if self.spill is None:
+            name = f"deep-assistant-lane-{os.getpid()}-{next(Lane.spill_ids)}.spill"
+            self.spill = SpillFile(os.path.join(self.spill_dir or tempfile.gettempdir(), name))
+        self.spill.push(event)
+
+    def popleft(self) -> Event:
+        if not self.pending:
+            return self.spill.pop()
+        event = self.pending.popleft()
+        if self.spill:
+            self.pending.append(self.spill.pop())
+        return event
+
+    def backlog(self) -> int:
+        return len(self.pending) + (len(self.spill) if self.spill is not None else 0)
+
+    def discard(self):
+        """Remove the spill file of a lane that stops with events still waiting"""
+        if self.spill:
+            os.remove(self.spill.path)
+
+
 class EventManager:
-    
-    immediate_events = asyncio.Queue() # events with high priority
-    delayed_events = asyncio.Queue() # events with low priority
+
+    immediate_events = EventQueue("immediate", 1000) # events with high priority
+    delayed_events = DelayedQueue("delayed", 1000) # events with low priority, ordered by deadline
+    backoff_base = 0.1 # seconds before the first retry of an event
+    backoff_max = 60.0
+    in_flight = asyncio.Semaphore(100) # caps handle_event calls running at once
+    max_in_flight = 100
+    overflow = "block"
+    max_lane_backlog = 100 # events waiting per partition key before the overflow policy applies, 0 for no limit
+    max_lane_events = 10000 # events waiting in memory across all lanes, 0 for no limit
+    lane_events = 0
+    lane_room = asyncio.Event() # set when lane_events drops below max_lane_events
+    spill_dir = None
+    lane_dropped = 0
+    lane_spilled = 0
+    tasks = set()
+    pools = {} # "thread"/"process" -> executor, created on first use
+    pool_workers = {"thread": None, "process": None}
     handlers = []
+    dispatch_table = {} # concrete event class -> handlers ordered by priority, built lazily
+    lanes = {} # partition key -> Lane, only while the key has events queued or running
+    journal = None # optional EventJournal (see src/journal.py), records adds and completions
+
+    @classmethod
+    def configure(
+        cls,
+        max_queue_size: int = 1000,
+        overflow: str = "block",
+        max_in_flight: int = 100,
+        spill_dir: Optional[str] = None,
+        thread_workers: Optional[int] = None,
+        process_workers: Optional[int] = None,
+        max_lane_backlog: int = 100,
+        max_lane_events: int = 10000,
+    ):
+        """Set queue bounds, overflow policy, the in-flight task cap, the lane backlogs and pool sizes, call before run()"""
+        cls.overflow = overflow
+        cls.spill_dir = spill_dir
+        cls.max_lane_backlog = max_lane_backlog
+        cls.max_lane_events = max_lane_events
+        cls.lane_room = asyncio.Event()
+        cls.pool_workers = {"thread": thread_workers, "process": process_workers}
+        cls.immediate_events = EventQueue("immediate", max_queue_size, overflow, spill_dir)
+        cls.delayed_events = DelayedQueue("delayed", max_queue_size, overflow)
+        cls.max_in_flight = max_in_flight
+        cls.in_flight = asyncio.Semaphore(max_in_flight)
 
     @classmethod
     async def run(cls):
-        loop.create_task(cls.run_immediate())
-        loop.create_task(cls.run_delayed())
+        running_loop = asyncio.get_running_loop()
+        running_loop.create_task(cls.run_immediate())
+        running_loop.create_task(cls.run_delayed())
 
     @classmethod
     async def run_immediate(cls):
         while True:
+            # wait for the event first: a slot held while idle is one no handler can use
             event = await cls.immediate_events.get()
-            loop.create_task(cls.handle_event(event))
-    
+            await cls.spawn(event)
+
     @classmethod
     async def run_delayed(cls):
         while True:
             event = await cls.delayed_events.get()
-            loop.create_task(cls.handle_event(event))
-            await asyncio.sleep(0.1) # sleep for a short time to prevent busy waiting
+            await cls.spawn(event)
+
+    @classmethod
+    def get_pool(cls, kind: str) -> concurrent.futures.Executor:
+        pool = cls.pools.get(kind)
+        if pool is None:
+            if kind == "thread":
+                pool = concurrent.futures.ThreadPoolExecutor(cls.pool_workers["thread"], thread_name_prefix="event-handler")
+            else:
+                # forking a process that runs an event loop and thread pools can copy held locks into the child
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                pool = concurrent.futures.ProcessPoolExecutor(cls.pool_workers["process"], mp_context=multiprocessing.get_context(method))
+            cls.pools[kind] = pool
+        return pool
+
+    @classmethod
+    async def shutdown(cls, timeout: Optional[float] = None):
+        """Wait for running handlers (up to ``timeout``), cancel the rest and close the pools"""
+        if cls.tasks:
+            done, pending = await asyncio.wait(set(cls.tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        pools, cls.pools = cls.pools, {}
+        for pool in pools.values():
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+        if cls.journal is not None:
+            cls.journal.close()
+            cls.journal = None
+
+    @classmethod
+    async def spawn(cls, event: Event):
+        """Start handling an event
+
+        Events without a partition key take an in_flight slot and get a task of
+        their own. Keyed events are appended to the lane of their key, which
+        runs them one after another and takes a slot only for the event it is
+        handling, so a long backlog on one key does not hold back other keys.
+
+        A lane whose backlog is full, or any lane once max_lane_events are
+        waiting in memory across all lanes, follows the overflow policy:
+        drop_oldest drops the oldest event waiting on that key (or the new one
+        if none is), spill writes the new event to the lane's file on disk, and
+        block keeps it in memory. Under block, spawn waits only when the shared
+        max_lane_events budget is used up, which in turn pushes back on the
+        immediate queue and its producers.
+        """
+        key = event.partition_key
+        if key is None:
+            await cls.in_flight.acquire()
+            task = asyncio.get_running_loop().create_task(cls.handle_event(event))
+            cls.tasks.add(task)
+            task.add_done_callback(cls._task_done)
+            return
+        while cls.overflow == "block" and cls.lanes_full():
+            cls.lane_room.clear()
+            await cls.lane_room.wait()
+        lane = cls.lanes.get(key)
+        new_lane = lane is None
+        if new_lane:
+            lane = Lane(key, cls.max_lane_backlog, cls.spill_dir)
+        if cls.overflow == "spill" and (lane.spill or lane.full() or cls.lanes_full()):
+            # keep arrival order: once something is on disk, newer events go there too
+            try:
+                lane.push_spill(event)
+            except Exception:
+                # e.g. an event that cannot be pickled, the dispatcher must keep going
+                logging.exception(f"Dropping {event!r}, it could not be spilled on lane {key!r}")
+                cls.lane_dropped += 1
+                cls.drop(event)
+                return
+            cls.lane_spilled += 1
+        elif cls.overflow == "drop_oldest" and (lane.full() or cls.lanes_full()):
+            cls.lane_dropped += 1
+            if not lane.pending:
+                cls.drop(event)
+                return
+            cls.drop(lane.pending.popleft())
+            lane.pending.append(event)
+        else:
+            lane.pending.append(event)
+            cls.lane_events += 1
+        if new_lane:
+            cls.lanes[key] = lane
+            lane.task = asyncio.get_running_loop().create_task(cls.run_lane(lane))
+            cls.tasks.add(lane.task)
+            lane.task.add_done_callback(cls.tasks.discard)
+
+    @classmethod
+    def lanes_full(cls) -> bool:
+        return 0 < cls.max_lane_events <= cls.lane_events
+
+    @classmethod
+    async def run_lane(cls, lane: Lane):
+        try:
+            while lane.backlog():
+                waiting = len(lane.pending)
+                event = lane.popleft()
+                cls.lane_events += len(lane.pending) - waiting
+                if not cls.lanes_full():
+                    cls.lane_room.set()
+                await cls.in_flight.acquire()
+                lane.active = True
+                try:
+                    await cls.handle_event(event)
+                except Exception:
+                    # a failing handler must not stall the events queued behind it
+                    logging.exception(f"Handler failed for {event!r} on lane {lane.key!r}")
+                finally:
+                    lane.active = False
+                    lane.handled += 1
+                    cls.in_flight.release()
+        finally:
+            # nothing can be appended between the last check and here, the lane is idle
+            # (or cancelled, and the journal still has its waiting events)
+            del cls.lanes[lane.key]
+            cls.lane_events -= len(lane.pending)
+            if not cls.lanes_full():
+                cls.lane_room.set()
+            lane.discard()
+
+    @classmethod
+    def _task_done(cls, task: asyncio.Task):
+        cls.tasks.discard(task)
+        cls.in_flight.release()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "immediate": cls.immediate_events.stats(),
+            "delayed": cls.delayed_events.stats(),
+            "in_flight": len(cls.tasks) - len(cls.lanes) + sum(lane.active for lane in cls.lanes.values()),
+            "lanes": len(cls.lanes),
+            "lane_backlog": max((lane.backlog() for lane in cls.lanes.values()), default=0),
+            "lane_events": cls.lane_events,
+            "lane_dropped": cls.lane_dropped,
+            "lane_spilled": cls.lane_spilled,
+            "max_in_flight": cls.max_in_flight,
+            "handlers": {
+                f"{h.func.__module__}.{h.func.__qualname__}": {"calls": h.calls, "in_flight": h.in_flight}
+                for h in cls.handlers
+            },
+        }
+
+    @classmethod
+    def get_handlers(cls, event_class: Type[Event]) -> list:
+        """Return the handlers for an event class, ordered by priority"""
+        try:
+            return cls.dispatch_table[event_class]
+        except KeyError:
+            pass
+        mro = set(event_class.__mro__)
+        # sorted() is stable, so handlers with equal priority keep their registration order
+        handlers = cls.dispatch_table[event_class] = sorted(
+            (h for h in cls.handlers if h.event_type in mro), key=lambda h: h.priority
+        )
+        return handlers
 
     @classmethod
     async def handle_event(cls, event: Event):
-        for event_type, handler, priority in sorted(cls.handlers, key=lambda x: x[2]):
-            if isinstance(event, event_type) and event.status != EventStatus.DEPRECATED:
+        journal = cls.journal
+        token = journal.begin(event) if journal is not None else None
+        in_handler.set(True)
+        try:
+            for handler in cls.get_handlers(type(event)):
+                if event.status == EventStatus.DEPRECATED:
+                    break
                 event.trigger_num += 1
                 result = await handler(event)
+        except asyncio.CancelledError:
+            # interrupted, e.g. by shutdown: it stays unfinished in the journal and runs again on the next start
+            raise
+        except Exception:
+            if journal is not None:
+                journal.finish(event, token)
+            raise
+        if journal is not None:
+            journal.finish(event, token)
+
+    @classmethod
+    def backoff(cls, trigger_num: int) -> float:
+        """Default delay before an event that has already been triggered runs again"""
+        return min(cls.backoff_base * 2 ** max(trigger_num - 1, 0), cls.backoff_max)
 
     @classmethod
-    async def add_event(cls, event: Event):
+    async def add_event(cls, event: Event, not_before: Optional[float] = None, block: Optional[bool] = None):
+        """Queue an event
+
+        New events go straight to the immediate queue. Events that were already
+        triggered, or that carry a ``not_before`` timestamp (time.time() clock),
+        are scheduled on the delayed queue; retries default to an exponential
+        backoff on ``trigger_num``.
+
+        Producers outside the manager wait for room under the block policy.
+        Events added by a running handler never wait: the handler holds an
+        in_flight slot, and if every running handler waited on a full queue no
+        slot would ever be released to drain it. ``block=False`` asks for the
+        same from any caller, e.g. to queue events before the dispatch loops run.
+
+        Thread handlers may call this from their worker thread, the event is
+        handed to the dispatching loop and queued there. Process handlers work
+        on a copy of the manager in another process and must not add events.
+        """
+        dispatch_loop = handler_loop.get()
+        if dispatch_loop is not None:
+            # the coroutine runs in a copy of this thread's context, _enqueue does not look at handler_loop again
+            future = asyncio.run_coroutine_threadsafe(cls._enqueue(event, not_before, False if block is None else block), dispatch_loop)
+            return await asyncio.wrap_future(future)
+        if block is None:
+            block = not in_handler.get()
+        await cls._enqueue(event, not_before, block)
+
+    @classmethod
+    async def _enqueue(cls, event: Event, not_before: Optional[float], block: bool):
+        """Queue an event on the running loop, add_event has resolved the thread handoff and block policy"""
         if event.status == EventStatus.PENDING:
-            if event.trigger_num == 0:
-                await cls.immediate_events.put(event)
+            if cls.journal is not None:
+                cls.journal.added(event)
+            if event.trigger_num == 0 and not_before is None:
+                dropped = await cls.immediate_events.put(event, block)
             else:
-                await cls.delayed_events.put(event)
+                if not_before is None:
+                    not_before = time.time() + cls.backoff(event.trigger_num)
+                dropped = await cls.delayed_events.put(event, not_before, block)
+            if dropped is not None:
+                cls.drop(dropped)
 
     @classmethod
-    def register(cls, event_type: Optional[Type[Event]] = None, priority: int = 0):
+    def drop(cls, event: Event):
+        """Give up on a queued event that an overflow policy dropped, the journal must not recover it"""
+        event.status = EventStatus.DEPRECATED
+        if cls.journal is not None:
+            cls.journal.dropped(event)
+
+    @classmethod
+    async def add_events(cls, events: Iterable[Event], block: Optional[bool] = None):
+        """Queue a batch of events in order, e.g. everything decoded from one read"""
+        for event in events:
+            await cls.add_event(event, block=block)
+
+    @classmethod
+    def register(cls, event_type: Optional[Type[Event]] = None, priority: int = 0, max_concurrency: int = 0, executor: str = "loop"):
+        """Register an event handler
+
+        max_concurrency limits how many calls of this handler may run at once, 0 means no limit.
+        executor picks where the handler runs: "loop" awaits it on the event loop,
+        "thread" and "process" run it (sync or async) in a managed pool. Process
+        handlers must be module-level functions, receive a pickled copy of the event
+        and cannot add events.
+        """
         def decorator(handler):
             nonlocal event_type
             if event_type is None:
                 event_type = handler.__annotations__['event']
-            cls.handlers.append((event_type, handler, priority))
+            cls.handlers.append(Handler(event_type, handler, priority, max_concurrency, executor))
+            cls.dispatch_table.clear()
             return handler
         return decorator
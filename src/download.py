@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+
+from .core import EventManager
+from .models import DownloadEvent, EventStatus, ImageSegment, MediaSegment, Message
+
+
+class MediaCache:
+    """
+    按内容寻址的磁盘缓存：文件以 SHA-256 命名存放在 directory/<前两位>/<摘要> 下，
+    总大小超过 max_bytes 时按最近使用时间淘汰。使用时间记在文件的 mtime 上，重启后从目录恢复。
+    """
+
+    def __init__(self, directory: str = "media/cache", max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # 摘要 -> 大小，按使用时间从旧到新
+        self.total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        found = []
+        for prefix in os.listdir(self.directory):
+            subdir = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(subdir):
+                continue
+            for digest in os.listdir(subdir):
+                stat = os.stat(os.path.join(subdir, digest))
+                found.append((stat.st_mtime, digest, stat.st_size))
+        for _, digest, size in sorted(found):
+            self.entries[digest] = size
+            self.total_bytes += size
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, digest: str) -> Optional[str]:
+        """
+        命中时返回缓存文件路径并把它标记为最近使用。
+        """
+        if digest not in self.entries:
+            return None
+        path = self.path(digest)
+        self.entries.move_to_end(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # 文件被外部删除了
+            self.total_bytes -= self.entries.pop(digest)
+            return None
+        return path
+
+    def tempfile(self):
+        """
+        在缓存目录中创建临时文件（与最终位置在同一文件系统，可以原子地 rename）。
+        """
+        fd, path = tempfile.mkstemp(prefix=".download-", suffix=".tmp", dir=self.directory)
+        return os.fdopen(fd, "wb"), path
+
+    def add(self, tmp_path: str, digest: str, size: int) -> str:
+        """
+        把下载完成的临时文件放进缓存；内容已存在时丢弃临时文件。
+        """
+        if self.get(digest) is not None:
+            os.unlink(tmp_path)
+            return self.path(digest)
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        self.entries[digest] = size
+        self.total_bytes += size
+        self.evict(keep=digest)
+        return path
+
+    def evict(self, keep: Optional[str] = None):
+        for digest in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            self.total_bytes -= self.entries.pop(digest)
+            try:
+                os.unlink(self.path(digest))
+            except FileNotFoundError:
+                pass
+            logging.info(f"Evicted cached media {digest}")
+
+
+class Downloader:
+    """
+    异步下载器：所有请求共用一个 HTTP 连接池，最多 max_concurrency 个同时进行，
+    响应按块流式写入磁盘，同一个 URL（或 key）同时只会下载一次，内容相同的文件只存一份。
+
+    key 是资源内容的稳定标识，例如 QQ 图片片段的 file 字段（由图片内容的摘要得到）：同一张图片每次转发的
+    URL 都不同，但 file 相同，命中后不必再下载。文件名之类不能唯一确定内容的字段不能当作 key。
+    """
+
+    def __init__(
+        self,
+        cache: Optional[MediaCache] = None,
+        max_concurrency: int = 8,
+        chunk_size: int = 64 * 1024,
+        max_retries: int = 3,
+        timeout: float = 60.0,
+        max_keys: int = 100_000,
+    ):
+        self.cache = cache or MediaCache()
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.max_keys = max_keys
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.http_client = httpx.AsyncClient(
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self.keys: "OrderedDict[str, str]" = OrderedDict()  # key -> 内容摘要，数量超过 max_keys 时丢弃最旧的
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.downloads = 0
+        self.hits = 0
+        self.shared = 0
+
+    async def fetch(self, url: str, key: Optional[str] = None) -> str:
+        """
+        返回资源在缓存中的路径，必要时下载。
+        """
+        key = key or url
+        digest = self.keys.get(key)
+        if digest is not None:
+            path = self.cache.get(digest)
+            if path is not None:
+                self.keys.move_to_end(key)
+                self.hits += 1
+                return path
+        future = self.in_flight.get(key)
+        if future is not None:
+            # 已经有请求在下载同一个资源，等它的结果
+            self.shared += 1
+            return await asyncio.shield(future)
+        future = self.in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            digest, path = await self.download(url)
+            self.keys[key] = digest
+            self.keys.move_to_end(key)
+            if len(self.keys) > self.max_keys:
+                self.keys.popitem(last=False)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有其他等待者时也不要报 "exception was never retrieved"
+            raise
+        finally:
+            del self.in_flight[key]
+
+    async def download(self, url: str):
+        async with self.semaphore:
+            file, tmp_path = self.cache.tempfile()
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with file:
+                    async with self.http_client.stream("GET", url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes(self.chunk_size):
+                            digest.update(chunk)
+                            file.write(chunk)
+                            size += len(chunk)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        self.downloads += 1
+        digest = digest.hexdigest()
+        return digest, self.cache.add(tmp_path, digest, size)
+
+    @staticmethod
+    def materialize(cached_path: str, path: str):
+        """
+        把缓存中的文件放到目标路径：优先硬链接，不支持时复制。
+        目标文件归调用方所有，不计入缓存大小，也不会随缓存淘汰而删除。
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            os.link(cached_path, path)
+        except OSError:
+            shutil.copyfile(cached_path, path)
+
+    async def handle(self, event: DownloadEvent):
+        """
+        DownloadEvent 的处理函数：成功后标记为 COMPLETE，失败时按 EventManager 的退避重新排队，
+        超过 max_retries 次后放弃。
+
+        event.path 非空时把文件放到该路径；为空时改成缓存中的路径，供之后的处理函数读取。
+        缓存中的文件可能在之后被淘汰，需要长期保存的调用方应当自己复制一份。
+        """
+        try:
+            cached_path = await self.fetch(event.url, event.key)
+            if event.path:
+                self.materialize(cached_path, event.path)
+            else:
+                event.path = cached_path
+            event.status = EventStatus.COMPLETE
+        except (httpx.HTTPError, OSError) as e:
+            client_error = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+            if client_error or event.trigger_num > self.max_retries:
+                logging.warning(f"Giving up downloading {event.url}: {e}")
+                event.status = EventStatus.DEPRECATED
+                return
+            logging.info(f"Download of {event.url} failed ({e}), retrying")
+            await EventManager.add_event(event)
+
+    def stats(self) -> dict:
+        return {
+            "downloads": self.downloads,
+            "hits": self.hits,
+            "shared": self.shared,
+            "in_flight": len(self.in_flight),
+            "cached_files": len(self.cache.entries),
+            "cached_bytes": self.cache.total_bytes,
+        }
+
+    async def close(self):
+        await self.http_client.aclose()
+
+
+def media_downloads(message: Message, directory: Optional[str] = None) -> List[DownloadEvent]:
+    """
+    为一条消息中的图片、语音、视频和文件片段生成下载事件。
+
+    默认只下载到缓存，处理完成后 event.path 是缓存中的路径；给出 directory 时文件另外放到
+    directory/<片段类型>/ 下，这些文件不受缓存的 max_bytes 限制，需要调用方自己清理。
+    """
+    events = []
+    for segment in message.segments:
+        if isinstance(segment, MediaSegment) and segment.url:
+            path = ""
+            if directory is not None:
+                name = os.path.basename(getattr(segment, "name", "") or segment.file) or hashlib.sha1(segment.url.encode()).hexdigest()
+                path = os.path.join(directory, segment.type.value, name)
+            # 只有图片的 file 是由内容摘要得到的文件名；文件片段的 file 就是文件名，不同的文件可能同名，按 URL 去重
+            key = (segment.file or None) if isinstance(segment, ImageSegment) else None
+            events.append(DownloadEvent(segment.url, path, key=key))
+    return events
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from typing import List
+
+from .llm import get_client
+from .tokens import estimate_tokens
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of an earlier part of a conversation between a user and an assistant. "
+    "Merge the new messages into the existing summary. Keep facts about the user, decisions and open questions, "
+    "drop small talk, and answer with the updated summary only, in at most {max_tokens} tokens."
+)
+
+
+def get_field(message, name: str):
+    """
+    历史消息既可能是 dict，也可能是 SDK 返回的消息对象。
+    """
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def message_tokens(message) -> int:
+    """
+    估算一条消息占用的 token 数，包括角色等固定开销和 tool_calls 的参数。
+    """
+    tokens = 4 + estimate_tokens(get_field(message, "content") or "")
+    for tool_call in get_field(message, "tool_calls") or ():
+        function = get_field(tool_call, "function")
+        tokens += 4 + estimate_tokens(get_field(function, "name") or "") + estimate_tokens(get_field(function, "arguments") or "")
+    return tokens
+
+
+def message_text(message) -> str:
+    """
+    把一条消息转成写摘要用的纯文本。
+    """
+    role = get_field(message, "role")
+    parts = [get_field(message, "content") or ""]
+    for tool_call in get_field(message, "tool_calls") or ():
+        function = get_field(tool_call, "function")
+        parts.append(f"[called {get_field(function, 'name')}({get_field(function, 'arguments')})]")
+    return f"{role}: {' '.join(part for part in parts if part)}"
+
+
+class ConversationHistory:
+    """
+    有 token 预算的对话历史。
+
+    超出预算时从最早的一轮开始整轮淘汰（一轮从 user 消息开始），带 tool_calls 的助手消息和对应的
+    tool 消息因此总是一起保留或一起淘汰；最近的一轮永远保留。被淘汰的消息在后台交给 LLM 合并进
+    滚动摘要，摘要作为一条系统消息放在历史最前面。
+    """
+
+    def __init__(self, token_budget: int = 6000, summarize: bool = True, summary_tokens: int = 300):
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.messages: List = []
+        self.sizes: List[int] = []  # 与 messages 一一对应的 token 估算
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_lock = asyncio.Lock()
+        self.summary_tasks = set()
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, message):
+        size = message_tokens(message)
+        self.messages.append(message)
+        self.sizes.append(size)
+        self.total_tokens += size
+        self.trim()
+
+    def turn_starts(self) -> List[int]:
+        return [i for i, message in enumerate(self.messages) if get_field(message, "role") == "user"]
+
+    def trim(self):
+        """
+        整轮淘汰最早的消息，直到估算的 token 数（含摘要）回到预算以内。
+        """
+        budget = self.token_budget - estimate_tokens(self.summary)
+        if self.total_tokens <= budget:
+            return
+        starts = self.turn_starts()
+        cut = 0
+        remaining = self.total_tokens
+        # starts[-1] 是最近一轮的开始，不能再往后切
+        for start in starts[1:]:
+            if remaining <= budget:
+                break
+            remaining -= sum(self.sizes[cut:start])
+            cut = start
+        if cut == 0:
+            return
+        evicted = self.messages[:cut]
+        del self.messages[:cut]
+        del self.sizes[:cut]
+        self.total_tokens = remaining
+        if self.summarize:
+            task = asyncio.get_running_loop().create_task(self.fold(evicted))
+            self.summary_tasks.add(task)
+            task.add_done_callback(self.summary_tasks.discard)
+
+    async def fold(self, evicted: List):
+        """
+        在后台把被淘汰的消息合并进滚动摘要；多个任务按淘汰顺序依次执行。
+        """
+        async with self.summary_lock:
+            transcript = "\n".join(message_text(message) for message in evicted)
+            try:
+                response = await get_client().create(
+                    [
+                        {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=self.summary_tokens)},
+                        {"role": "user", "content": f"Existing summary:\n{self.summary or '(empty)'}\n\nNew messages:\n{transcript}"},
+                    ],
+                    max_tokens=self.summary_tokens,
+                    temperature=0,
+                )
+                self.summary = response.choices[0].message.content or self.summary
+            except Exception as e:
+                logging.warning(f"Failed to summarize {len(evicted)} evicted messages: {e}")
+
+    async def wait(self):
+        """
+        等待正在进行的摘要任务完成。
+        """
+        if self.summary_tasks:
+            await asyncio.gather(*self.summary_tasks, return_exceptions=True)
+
+    def to_messages(self) -> List:
+        """
+        返回发送给 LLM 的历史消息，有摘要时放在最前面。
+        """
+        if not self.summary:
+            return list(self.messages)
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}, *self.messages]
+
+    def to_dict(self) -> dict:
+        """
+        可序列化的形式，SDK 返回的消息对象会被转换成 dict。
+        """
+        return {
+            "summary": self.summary,
+            "messages": [message if isinstance(message, dict) else message.model_dump(exclude_none=True) for message in self.messages],
+        }
+
+    def load_dict(self, data: dict):
+        self.summary = data.get("summary", "")
+        self.messages = list(data.get("messages", []))
+        self.sizes = [message_tokens(message) for message in self.messages]
+        self.total_tokens = sum(self.sizes)
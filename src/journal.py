@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+import zlib
+from typing import Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from . import models
+from .core import EventManager
+from .models import Event, EventStatus
+
+# record header: payload length, crc32 of the payload, record kind, time.time() of the write
+HEADER = struct.Struct(">IIBd")
+ADDED = 1 # payload is (journal key, pickled event), written every time it is queued
+FINISHED = 2 # payload is (journal key, status value), written once its handlers have run
+
+
+def read_records(path: str) -> Iterator[Tuple[int, float, bytes, int]]:
+    """Yield (kind, timestamp, payload, end offset) from a journal through a read-only mmap
+
+    Stops at the first record that is cut short or fails its checksum, which
+    is what a crash in the middle of an append leaves behind.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            while offset + HEADER.size <= len(mm):
+                length, crc, kind, timestamp = HEADER.unpack_from(mm, offset)
+                start = offset + HEADER.size
+                payload = mm[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                offset = start + length
+                yield kind, timestamp, payload, offset
+
+
+def encode(kind: int, payload: bytes, timestamp: Optional[float] = None) -> bytes:
+    return HEADER.pack(len(payload), zlib.crc32(payload), kind, time.time() if timestamp is None else timestamp) + payload
+
+
+def load_added(payload: bytes) -> Tuple[Hashable, Event]:
+    key, data = pickle.loads(payload)
+    return key, pickle.loads(data)
+
+
+class EventJournal:
+    """Append-only log of events as they are queued and finished
+
+    EventManager calls ``added`` from add_event, ``begin``/``finish`` around
+    handle_event and ``dropped`` for events an overflow policy discards. An
+    event whose last record is ADDED was queued but never finished; those are
+    what ``recover`` returns. If a handler re-queues the event it is handling
+    (a retry), no FINISHED record is written for that run.
+
+    Records are keyed by (run, event id) with a prefix drawn per journal
+    instance, since integer event ids (see models.use_integer_ids) restart at 1
+    in every process. Recovered events with integer ids get a fresh id for the
+    same reason.
+
+    After ``compact_every`` records the journal is rewritten to hold only the
+    events still open, so a long run does not grow it without bound. The
+    ``keep`` previous generations stay next to it as <path>.1, <path>.2, ...
+    for replay.
+    """
+
+    def __init__(self, path: str, fsync: bool = False, compact_every: int = 100_000, keep: int = 1):
+        self.path = path
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.keep = keep
+        self.run = uuid.uuid4().hex[:12]
+        self.open_records = {} # journal key -> (sequence number, encoded record) of its latest ADDED
+        self.seq = 0
+        self.records = 0
+        self.since_compaction = 0
+        self.file = None
+
+    def key(self, event: Event) -> Hashable:
+        return (self.run, event.id)
+
+    def open(self):
+        self.file = open(self.path, "ab")
+
+    def write(self, record: bytes):
+        self.file.write(record)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.records += 1
+        self.since_compaction += 1
+        if self.compact_every and self.since_compaction >= self.compact_every:
+            self.compact()
+
+    def add_record(self, key: Hashable, data: bytes, timestamp: Optional[float] = None) -> bytes:
+        self.seq += 1
+        record = encode(ADDED, pickle.dumps((key, data), protocol=pickle.HIGHEST_PROTOCOL), timestamp)
+        self.open_records[key] = (self.seq, record)
+        return record
+
+    def added(self, event: Event):
+        try:
+            data = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logging.warning(f"Event {event!r} cannot be journaled: {e}")
+            return
+        self.write(self.add_record(self.key(event), data))
+
+    def begin(self, event: Event) -> Optional[int]:
+        entry = self.open_records.get(self.key(event))
+        return entry[0] if entry is not None else None
+
+    def finish(self, event: Event, token: Optional[int]):
+        key = self.key(event)
+        entry = self.open_records.get(key)
+        if (entry[0] if entry is not None else None) != token:
+            return # queued again while it was being handled, the newer record stays open
+        self.open_records.pop(key, None)
+        self.write(encode(FINISHED, pickle.dumps((key, event.status.value), protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def dropped(self, event: Event):
+        """Close the record of a queued event that was dropped before its handlers ran"""
+        key = self.key(event)
+        if self.open_records.pop(key, None) is not None:
+            self.write(encode(FINISHED, pickle.dumps((key, EventStatus.DEPRECATED.value), protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def rewrite(self, records: Iterable[bytes]):
+        """Atomically replace the journal with ``records``, keeping the old file as generation 1"""
+        fd, tmp_path = tempfile.mkstemp(prefix=".journal-", suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, "wb") as f:
+            for record in records:
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.keep > 0 and os.path.exists(self.path):
+            for generation in range(self.keep - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{generation}"):
+                    os.replace(f"{self.path}.{generation}", f"{self.path}.{generation + 1}")
+            if os.path.exists(f"{self.path}.1"):
+                os.remove(f"{self.path}.1")
+            # link rather than rename, so there is no moment without a journal at self.path
+            try:
+                os.link(self.path, f"{self.path}.1")
+            except OSError:
+                shutil.copyfile(self.path, f"{self.path}.1")
+        os.replace(tmp_path, self.path)
+
+    def compact(self):
+        """Rewrite the journal to hold only the open events, then keep appending to the new file"""
+        if self.file is not None:
+            self.file.close()
+        self.rewrite(record for _, record in self.open_records.values())
+        self.since_compaction = 0
+        self.open()
+
+    def recover(self) -> List[Event]:
+        """Return the events that were queued but not finished, and rewrite the journal to hold only those
+
+        The rewrite goes through a temporary file and os.replace, so a crash
+        during recovery leaves either the old or the compacted journal.
+        """
+        if not os.path.exists(self.path):
+            return []
+        pending = {} # journal key -> its latest ADDED record, in the order they were last queued
+        valid_end = 0
+        for kind, timestamp, payload, end in read_records(self.path):
+            valid_end = end
+            if kind == ADDED:
+                key, data = pickle.loads(payload)
+                pending.pop(key, None)
+                pending[key] = (timestamp, data)
+            elif kind == FINISHED:
+                key, status = pickle.loads(payload)
+                pending.pop(key, None)
+        if valid_end < os.path.getsize(self.path):
+            logging.warning(f"Dropping a truncated record at the end of {self.path}")
+        events = []
+        records = []
+        for timestamp, data in pending.values():
+            event = pickle.loads(data)
+            if event.status != EventStatus.PENDING:
+                continue
+            if isinstance(event.id, int):
+                # the counter restarted with this process, keep the id from colliding with new events
+                event.id = models.new_event_id()
+                data = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+            records.append(self.add_record(self.key(event), data, timestamp))
+            events.append(event)
+        self.rewrite(records)
+        return events
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+async def open_journal(path: str, fsync: bool = False, **options) -> EventJournal:
+    """Attach a journal to EventManager, re-queueing the events a previous run left unfinished
+
+    options (compact_every, keep) are passed on to EventJournal.
+    """
+    journal = EventJournal(path, fsync, **options)
+    events = journal.recover()
+    journal.open()
+    # they are already in the compacted journal, so queue them without another ADDED record.
+    # This runs before EventManager.run(), nothing drains the queues yet, so a crash that
+    # left more events than a queue holds must not wait for room
+    await EventManager.add_events(events, block=False)
+    EventManager.journal = journal
+    if events:
+        logging.info(f"Recovered {len(events)} unfinished events from {path}")
+    return journal
+
+
+async def replay(path: str, speed: Optional[float] = 1.0, batch_size: int = 256) -> int:
+    """Push the events recorded in a journal through EventManager again, returns how many
+
+    speed scales the original inter-arrival times (2.0 is twice as fast);
+    None or 0 replays as fast as the queues accept. Only first arrivals are
+    replayed, retries are left to the handlers to produce again.
+    """
+    count = 0
+    batch = []
+    first = None
+    start = time.monotonic()
+    for kind, timestamp, payload, _ in read_records(path):
+        if kind != ADDED:
+            continue
+        key, event = load_added(payload)
+        if event.trigger_num != 0:
+            continue
+        if speed:
+            if first is None:
+                first = timestamp
+            delay = (timestamp - first) / speed - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await EventManager.add_event(event)
+        else:
+            batch.append(event)
+            if len(batch) >= batch_size:
+                await EventManager.add_events(batch)
+                batch = []
+        count += 1
+    await EventManager.add_events(batch)
+    return count
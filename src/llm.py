@@ -0,0 +1,349 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
+from openai.types.chat.chat_completion_chunk import ChoiceDelta, ChoiceDeltaToolCall, ChoiceDeltaToolCallFunction
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from .llm_cache import ELIGIBILITY, ResponseCache, open_cache
+
+DEFAULT_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
+DEFAULT_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+DEFAULT_MODEL = os.environ.get("DEEPSEEK_MODEL", "deepseek-chat")
+# 响应缓存："memory" 或 SQLite 文件路径，不设置则不缓存
+DEFAULT_CACHE = os.environ.get("LLM_CACHE")
+# 哪些请求可以缓存，见 llm_cache.ELIGIBILITY
+DEFAULT_CACHE_POLICY = os.environ.get("LLM_CACHE_POLICY", "chat")
+# 请求的默认 temperature，不设置则使用服务端的默认值（默认策略下这样的请求不缓存）
+DEFAULT_TEMPERATURE = float(os.environ["LLM_TEMPERATURE"]) if os.environ.get("LLM_TEMPERATURE") else None
+
+# 这些错误通常是暂时的，值得重试
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # 包括 APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，rate 为每秒补充的令牌数，capacity 为允许的突发量。rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# 句子结束的位置：中英文句末标点、换行，或后面跟着空白的英文句点
+SENTENCE_END = re.compile(r"[。！？!?\n]|\.(?=\s)")
+
+
+async def replay_chunks(response: ChatCompletion):
+    """
+    把一个完整的响应（例如缓存命中的结果）还原成一个流式数据块，供 MessageStream 按正常流程读取。
+    """
+    choice = response.choices[0]
+    tool_calls = [
+        ChoiceDeltaToolCall(
+            index=index,
+            id=tool_call.id,
+            type="function",
+            function=ChoiceDeltaToolCallFunction(name=tool_call.function.name, arguments=tool_call.function.arguments),
+        )
+        for index, tool_call in enumerate(choice.message.tool_calls or ())
+    ]
+    yield ChatCompletionChunk(
+        id=response.id,
+        object="chat.completion.chunk",
+        created=response.created,
+        model=response.model,
+        choices=[
+            ChunkChoice(
+                index=0,
+                delta=ChoiceDelta(role="assistant", content=choice.message.content, tool_calls=tool_calls or None),
+                finish_reason=choice.finish_reason,
+            )
+        ],
+    )
+
+
+class MessageStream:
+    """
+    流式响应。迭代时逐个产出内容增量，同时增量拼装 tool_calls；迭代结束后 message 为完整的响应消息。
+    不读完就放弃的流要 await close()，否则底层的 HTTP 连接要等到迭代器被回收时才会还给连接池。
+    """
+
+    def __init__(self, chunks, on_close: Optional[Callable[[], None]] = None):
+        self.chunks = chunks
+        self.on_close = on_close
+        self.id = ""
+        self.model = ""
+        self.created = 0
+        self.content: List[str] = []
+        self.tool_calls: Dict[int, dict] = {}  # index -> {"id", "name", "arguments"}
+        self.finish_reason: Optional[str] = None
+        self.usage = None
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.chunks:
+                if not self.id:
+                    self.id, self.model, self.created = chunk.id, chunk.model, chunk.created
+                if chunk.usage:
+                    self.usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    self.finish_reason = choice.finish_reason
+                delta = choice.delta
+                for tool_call in delta.tool_calls or ():
+                    entry = self.tool_calls.setdefault(tool_call.index, {"id": "", "name": "", "arguments": []})
+                    if tool_call.id:
+                        entry["id"] = tool_call.id
+                    if tool_call.function:
+                        if tool_call.function.name:
+                            entry["name"] += tool_call.function.name
+                        if tool_call.function.arguments:
+                            entry["arguments"].append(tool_call.function.arguments)
+                if delta.content:
+                    self.content.append(delta.content)
+                    yield delta.content
+        finally:
+            await self.close()
+
+    async def sentences(self):
+        """
+        按句子产出内容，便于在生成完成前就把第一句话发出去。
+        """
+        buffer = ""
+        async for delta in self:
+            buffer += delta
+            end = None
+            for end in SENTENCE_END.finditer(buffer):
+                pass
+            if end is not None:
+                yield buffer[:end.end()]
+                buffer = buffer[end.end():]
+        if buffer:
+            yield buffer
+
+    async def collect(self) -> ChatCompletionMessage:
+        """
+        读完整个流并返回完整的响应消息。
+        """
+        async for _ in self:
+            pass
+        return self.message
+
+    @property
+    def message(self) -> ChatCompletionMessage:
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=entry["id"],
+                type="function",
+                function=Function(name=entry["name"], arguments="".join(entry["arguments"])),
+            )
+            for _, entry in sorted(self.tool_calls.items())
+        ]
+        return ChatCompletionMessage(role="assistant", content="".join(self.content) or None, tool_calls=tool_calls or None)
+
+    def completion(self) -> ChatCompletion:
+        """
+        读完的流对应的非流式响应对象，用于写入缓存。
+        """
+        return ChatCompletion(
+            id=self.id,
+            object="chat.completion",
+            created=self.created,
+            model=self.model,
+            choices=[Choice(index=0, message=self.message, finish_reason=self.finish_reason)],
+            usage=self.usage,
+        )
+
+    async def close(self):
+        # 关闭底层的 HTTP 响应（缓存重放时是生成器），读完的流再关闭一次也没有副作用
+        aclose = getattr(self.chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+
+class LLMClient:
+    """
+    共享的异步 LLM 客户端：保持长连接的连接池、并发上限、令牌桶限速以及带抖动的指数退避重试。
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = DEFAULT_BASE_URL,
+        model: str = DEFAULT_MODEL,
+        max_concurrency: int = 16,
+        rate: float = 0,
+        burst: int = 10,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        timeout: float = 120.0,
+        cache: Optional[ResponseCache] = None,
+        temperature: Optional[float] = DEFAULT_TEMPERATURE,
+    ):
+        api_key = api_key or DEFAULT_API_KEY
+        if not api_key:
+            raise RuntimeError("No LLM API key: set the DEEPSEEK_API_KEY environment variable or pass api_key")
+        self.model = model
+        self.cache = cache
+        self.temperature = temperature  # 请求没有指定 temperature 时使用，None 表示不发送
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=timeout,
+        )
+        # 重试由我们自己完成，关闭 SDK 内置的重试
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+
+    def defaults(self) -> dict:
+        return {"temperature": self.temperature} if self.temperature is not None else {}
+
+    def lookup(self, request: dict, cache_messages: Optional[list]):
+        """
+        查询响应缓存，返回 (key, 缓存的响应)。cache_messages 不为空时代替 messages 参与缓存 key 的计算，
+        例如去掉了当前时间的版本，否则每秒都会变的上下文会让每个请求的 key 都不同。
+        """
+        if self.cache is None:
+            return None, None
+        if cache_messages is not None:
+            request = {**request, "messages": cache_messages}
+        # stream 相关参数不影响响应内容
+        request = {name: value for name, value in request.items() if name not in ("stream", "stream_options")}
+        return self.cache.lookup(request)
+
+    async def create(self, messages: list, tools: Optional[list] = None, cache_messages: Optional[list] = None, **params):
+        """
+        发送一次 chat completion 请求，返回完整的响应对象。配置了缓存时，符合条件的请求可能直接由缓存返回。
+        """
+        request = {"model": self.model, "messages": messages, **self.defaults(), **params}
+        if tools:
+            request["tools"] = tools
+        key, response = self.lookup(request, cache_messages)
+        if response is not None:
+            return response
+        async with self.semaphore:
+            response = await self.request(self.client.chat.completions.create, **request)
+        if key is not None:
+            self.cache.store(key, response)
+        return response
+
+    async def stream(self, messages: list, tools: Optional[list] = None, cache_messages: Optional[list] = None, **params) -> MessageStream:
+        """
+        以流式模式发送请求。并发名额一直占用到流被读完或关闭为止。
+        缓存命中时不发请求，把缓存的响应作为流重放；未命中时，完整读完且正常结束的流写入缓存。
+        """
+        request = {"model": self.model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}, **self.defaults(), **params}
+        if tools:
+            request["tools"] = tools
+        key, response = self.lookup(request, cache_messages)
+        if response is not None:
+            return MessageStream(replay_chunks(response))
+        await self.semaphore.acquire()
+        try:
+            chunks = await self.request(self.client.chat.completions.create, **request)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        stream = MessageStream(chunks)
+
+        def on_close():
+            self.semaphore.release()
+            # 没有 finish_reason 说明流被提前关闭，内容不完整
+            if key is not None and stream.finish_reason is not None:
+                self.cache.store(key, stream.completion())
+
+        stream.on_close = on_close
+        return stream
+
+    async def request(self, call, **request):
+        """
+        在限速之下执行请求，遇到可重试的错误时按带抖动的指数退避重试。调用方负责占用并发名额。
+        """
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                return await call(**request)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                logging.warning(f"LLM request failed ({e.__class__.__name__}: {e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def send_messages(self, messages: list, tools: Optional[list] = None, **params):
+        """
+        发送消息到 LLM 并获取响应消息。
+        """
+        response = await self.create(messages, tools=tools, **params)
+        return response.choices[0].message
+
+    async def close(self):
+        await self.client.close()
+        await self.http_client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+
+_client: Optional[LLMClient] = None
+
+
+def get_client() -> LLMClient:
+    """
+    获取进程内共享的 LLM 客户端，第一次调用时按默认配置创建。
+    """
+    global _client
+    if _client is None:
+        cache = ResponseCache(open_cache(DEFAULT_CACHE), ELIGIBILITY[DEFAULT_CACHE_POLICY]) if DEFAULT_CACHE else None
+        _client = LLMClient(cache=cache)
+    return _client
+
+
+def set_client(client: LLMClient):
+    """
+    替换共享客户端，例如指向本地的 OpenAI 兼容测试服务器。
+    """
+    global _client
+    _client = client
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from openai.types.chat import ChatCompletion
+
+from .metrics import registry
+
+
+def to_plain(value):
+    """
+    把请求中的 SDK 对象（例如历史里的 ChatCompletionMessage）转换成普通的 dict / list。
+    """
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def request_key(request: dict) -> str:
+    """
+    请求的稳定哈希：messages、tools 和模型参数规范化（去掉 None、键排序、紧凑分隔符）后取 SHA-256。
+    字段顺序、SDK 对象还是 dict 都不影响结果。
+    """
+    canonical = json.dumps(to_plain(request), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def deterministic_only(request: dict) -> bool:
+    """
+    严格的缓存条件：temperature 为 0，且不会产生工具调用（没有 tools 或 tool_choice 为 "none"）。
+    对话轮次总是带着 tools，只有 history 中的滚动摘要这类请求满足它。
+    """
+    if request.get("temperature") != 0:
+        return False
+    return not request.get("tools") or request.get("tool_choice") == "none"
+
+
+def final_answers(request: dict) -> bool:
+    """
+    默认的缓存条件，对话轮次也适用：带 tools 的请求同样可以缓存，但只有正常结束（没有工具调用）的响应
+    会写入缓存，所以命中时不会跳过任何工具调用，重复的问题或指令直接得到上次的回答。
+    只缓存 temperature 为 0 的请求：没有设置 temperature 时服务端按默认温度采样，不能把一次采样的结果重放给每次提问。
+    要缓存对话轮次，需要显式地以 temperature 0 请求（例如设置 LLM_TEMPERATURE=0），否则它们只是跳过缓存。
+    """
+    return request.get("temperature") == 0
+
+
+# LLM_CACHE_POLICY 的取值
+ELIGIBILITY = {"chat": final_answers, "deterministic": deterministic_only}
+
+
+class MemoryCache:
+    """
+    进程内的 LRU 缓存，条目在 ttl 秒后过期（ttl <= 0 表示不过期）。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (过期时间, 响应)
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at and expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: ChatCompletion):
+        self.entries[key] = (time.time() + self.ttl if self.ttl > 0 else 0, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self):
+        pass
+
+
+class SQLiteCache:
+    """
+    磁盘上的缓存，重启后仍然有效。超过 max_entries 时按最近使用时间淘汰，过期条目在读取和写入时清理。
+    """
+
+    def __init__(self, file_path: str = "llm_cache.db", max_entries: int = 100_000, ttl: float = 7 * 24 * 3600):
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.conn = sqlite3.connect(file_path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses(used_at)")
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        row = self.conn.execute("SELECT response, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, expires_at = row
+        now = time.time()
+        if expires_at and expires_at < now:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self.conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        return ChatCompletion.model_validate_json(response)
+
+    def put(self, key: str, response: ChatCompletion):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, response.model_dump_json(exclude_none=True), now + self.ttl if self.ttl > 0 else 0, now),
+        )
+        self.conn.execute("DELETE FROM responses WHERE expires_at > 0 AND expires_at < ?", (now,))
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at LIMIT ?)", (overflow,)
+            )
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def open_cache(spec: str):
+    """
+    按配置字符串创建缓存："memory" 为进程内缓存，其余视为 SQLite 文件路径。
+    """
+    if spec == "memory":
+        return MemoryCache()
+    os.makedirs(os.path.dirname(os.path.abspath(spec)), exist_ok=True)
+    return SQLiteCache(spec)
+
+
+class ResponseCache:
+    """
+    LLMClient.create 前面的响应缓存：符合 eligible 条件的请求先查缓存，未命中时请求 LLM，
+    正常结束（finish_reason 为 stop）的响应写入缓存。命中、未命中和不适用的次数记录在 metrics 中。
+    """
+
+    def __init__(self, backend, eligible: Callable[[dict], bool] = final_answers):
+        self.backend = backend
+        self.eligible = eligible
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def lookup(self, request: dict):
+        """
+        返回 (key, 缓存的响应)；请求不适合缓存时 key 为 None。
+        """
+        if not self.eligible(request):
+            self.skipped += 1
+            registry.inc("llm_cache_requests_total", result="skip")
+            return None, None
+        key = request_key(request)
+        response = self.backend.get(key)
+        if response is None:
+            self.misses += 1
+            registry.inc("llm_cache_requests_total", result="miss")
+        else:
+            self.hits += 1
+            registry.inc("llm_cache_requests_total", result="hit")
+        return key, response
+
+    def store(self, key: str, response: ChatCompletion):
+        if response.choices and response.choices[0].finish_reason == "stop":
+            self.backend.put(key, response)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.backend),
+        }
+
+    def close(self):
+        self.backend.close()
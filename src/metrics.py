@@ -0,0 +1,259 @@
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13)
+
+
+class Histogram:
+    """
+    固定分桶的直方图，和 Prometheus 的 histogram 语义一致（桶计数是累积的）。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        按桶的上界估算分位数。
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets, itertools.accumulate(self.counts)):
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """
+    进程内的指标表，按 (名称, 标签) 保存直方图和计数器。
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.help: Dict[str, str] = {}
+
+    def histogram(self, name: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        return histogram
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def render_prometheus(self) -> str:
+        """
+        渲染成 Prometheus 文本格式。
+        """
+        def label_text(labels: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(labels) + ([extra] if extra else [])
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{label_text(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, cumulative in zip(histogram.buckets, itertools.accumulate(histogram.counts)):
+                lines.append(f"{name}_bucket{label_text(labels, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{label_text(labels, ('le', '+Inf'))} {histogram.count}")
+            lines.append(f"{name}_sum{label_text(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+exporters: List = []
+
+
+def add_exporter(exporter):
+    """
+    注册一个导出器，每轮对话结束时会调用它的 export(record)。
+    """
+    exporters.append(exporter)
+
+
+class JsonLinesExporter:
+    """
+    把每轮对话的记录追加到 JSON lines 文件。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def export(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class PrometheusExporter:
+    """
+    在本地端口上以 Prometheus 文本格式暴露 registry 中的指标，指标在抓取时才渲染。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108):
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    def export(self, record: dict):
+        pass
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logging.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # 只需要读完请求头，路径一律返回指标
+            while (await reader.readline()).strip():
+                pass
+            body = registry.render_prometheus().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class Span:
+    def __init__(self, turn: "Turn", name: str, attributes: dict):
+        self.turn = turn
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.turn.spans.append(self)
+        registry.histogram("agent_span_seconds", span=self.name).observe(self.duration)
+        return False
+
+
+class Turn:
+    """
+    一轮对话的计时和用量记录：包含 LLM 调用、工具执行、记忆落盘等 span，以及 API 返回的 token 用量。
+    作为上下文管理器使用时，退出时总会调用 finish()，出错的一轮也会留下记录，其中的 error 是异常类型。
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, **attributes):
+        self.id = next(Turn.ids)
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.timestamp = time.time()
+        self.spans: List[Span] = []
+        self.llm_calls = 0
+        self.tool_rounds = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def __enter__(self) -> "Turn":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.finish()
+        return False
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, attributes)
+
+    def add_usage(self, usage):
+        """
+        累加一次 API 响应中的 usage（可能为空，例如流被提前关闭）。
+        """
+        self.llm_calls += 1
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+        # DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 放在 prompt_tokens_details.cached_tokens
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None and getattr(usage, "prompt_tokens_details", None) is not None:
+            cached = usage.prompt_tokens_details.cached_tokens
+        self.cached_tokens += cached or 0
+
+    def finish(self) -> dict:
+        """
+        结束这一轮：写入直方图并交给所有导出器，返回这一轮的记录。
+        """
+        duration = time.perf_counter() - self.start
+        registry.histogram("agent_turn_seconds").observe(duration)
+        registry.histogram("agent_turn_tool_rounds", COUNT_BUCKETS).observe(self.tool_rounds)
+        registry.histogram("agent_turn_prompt_tokens", TOKEN_BUCKETS).observe(self.prompt_tokens)
+        registry.histogram("agent_turn_completion_tokens", TOKEN_BUCKETS).observe(self.completion_tokens)
+        registry.inc("agent_turns_total")
+        if "error" in self.attributes:
+            registry.inc("agent_turn_errors_total", error=self.attributes["error"])
+        registry.inc("agent_tokens_total", self.prompt_tokens, kind="prompt")
+        registry.inc("agent_tokens_total", self.completion_tokens, kind="completion")
+        registry.inc("agent_tokens_total", self.cached_tokens, kind="cached")
+        record = {
+            "turn": self.id,
+            "timestamp": self.timestamp,
+            "duration": duration,
+            "llm_calls": self.llm_calls,
+            "tool_rounds": self.tool_rounds,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "spans": [{"name": span.name, "start": span.start - self.start, "duration": span.duration, **span.attributes} for span in self.spans],
+            **self.attributes,
+        }
+        for exporter in exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logging.warning(f"Metrics exporter {exporter.__class__.__name__} failed: {e}")
+        return record
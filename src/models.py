@@ -1,6 +1,7 @@
 from enum import Enum
+import itertools
 import time
-from typing import Optional
+from typing import Hashable, Optional, Union
 import uuid
 import datetime
 
@@ -17,13 +18,25 @@ class EventStatus(Enum):
     DEPRECATED = "deprecated"
 
 
+# Event ids default to uuid4, use_integer_ids() switches to a cheaper process-wide counter
+new_event_id = uuid.uuid4
+
+
+def use_integer_ids(enabled: bool = True):
+    """Give new events monotonic integer ids (unique within this process) instead of UUID4"""
+    global new_event_id
+    new_event_id = itertools.count(1).__next__ if enabled else uuid.uuid4
+
+
 class Event:
     """Event is a base class for all events"""
 
+    __slots__ = ("_raw_data", "time", "id", "status", "trigger_num", "name", "summary", "creator", "source")
+
     def __init__(
         self,
         timestamp: Optional[float] = None,
-        id: Optional[uuid.UUID] = None,
+        id: Optional[Union[uuid.UUID, int]] = None,
         status: EventStatus = EventStatus.PENDING,
         trigger_num: int = 0,
         name: str = "untitled",
@@ -32,9 +45,10 @@ class Event:
         source: str = "unknown",
         **raw_data,
     ):
-        self.raw_data = raw_data
+        # most events carry no extra fields, the empty dict is only created if someone asks for it
+        self._raw_data: Optional[dict] = raw_data or None
         self.time = timestamp if timestamp is not None else time.time()
-        self.id = id if id is not None else uuid.uuid4()
+        self.id = id if id is not None else new_event_id()
         self.status = status
         self.trigger_num = trigger_num
         self.name = name
@@ -42,6 +56,21 @@ class Event:
         self.creator = creator
         self.source = source
 
+    @property
+    def raw_data(self) -> dict:
+        if self._raw_data is None:
+            self._raw_data = {}
+        return self._raw_data
+
+    @raw_data.setter
+    def raw_data(self, raw_data: dict):
+        self._raw_data = raw_data
+
+    @property
+    def partition_key(self) -> Optional[Hashable]:
+        """Events with the same key are handled one at a time in order, None means no ordering"""
+        return None
+
     def __str__(self):
         return (
             f"{datetime.datetime.fromtimestamp(self.time)}: {self.name} ({self.status})"
@@ -52,10 +81,32 @@ class Event:
 
 
 class DownloadEvent(Event):
-    def __init__(self, url: str, path: str, **raw_data):
+    __slots__ = ("url", "path", "key")
+
+    def __init__(self, url: str, path: str = "", key: Optional[str] = None, **raw_data):
         super().__init__(**raw_data)
         self.url = url
-        self.path = path
+        self.path = path # where to place the file, empty to leave it in the media cache (the handler fills in that path)
+        self.key = key # stable identity of the content when the url is not, e.g. a QQ image's hash-derived file name
+
+
+class PartialReplyEvent(Event):
+    """A piece of an assistant reply that is still being generated"""
+
+    __slots__ = ("text", "index", "reply_to")
+
+    def __init__(self, text: str, index: int, reply_to: Optional["Message"] = None, **raw_data):
+        super().__init__(**raw_data)
+        self.text = text
+        self.index = index # position of this piece within the reply
+        self.reply_to = reply_to
+
+    @property
+    def partition_key(self) -> Optional[Hashable]:
+        # pieces of one conversation's replies go out in order, on a lane separate from its messages
+        if self.reply_to is None:
+            return None
+        return ("reply", *self.reply_to.conversation_key)
 
 
 class MessageSegmentType(Enum):
@@ -73,26 +124,46 @@ class MessageType(Enum):
     PRIVATE = "private"
     GROUP = "group"
 
+# 片段类型字符串 -> 片段类，由 register_segment 填充，解析时只查一次字典
+SEGMENT_CLASSES: dict[str, type] = {}
+
+
+def register_segment(segment_type: MessageSegmentType):
+    """注册某种片段类型对应的类"""
+    def decorator(cls):
+        cls.segment_type = segment_type
+        SEGMENT_CLASSES[segment_type.value] = cls
+        return cls
+    return decorator
+
+
 class MessageSegment:
     """基类，用于表示消息片段的通用部分"""
+    __slots__ = ("type", "data")
+    segment_type: Optional[MessageSegmentType] = None  # 具体片段类的类型，注册时设置
+
     def __init__(self, raw_data: dict):
-        self.type = self._determine_type(raw_data)  # 根据传入数据确定类型
-        self.data = raw_data.get("data", {})  # 通用数据
+        # 具体片段类的类型是固定的，只有直接构造基类时才需要从数据中判断
+        self.type = self.segment_type or self._determine_type(raw_data)
+        data = raw_data.get("data")
+        self.data = data if isinstance(data, dict) else {}  # 通用数据
 
     @staticmethod
     def _determine_type(raw_data: dict) -> MessageSegmentType:
         try:
             return MessageSegmentType(raw_data.get("type", "unknown"))
-        except ValueError:
+        except (ValueError, TypeError):
             return MessageSegmentType.UNKNOWN
         
     @staticmethod
     def from_dict(data: dict):
-        segment_type = MessageSegmentType(data.get("type", "unknown"))
-        if segment_type == MessageSegmentType.TEXT:
-            return TextSegment(data)
-        else:
-            return UnknownSegment(data)
+        """按 type 查表构造片段，未知类型或格式不对的数据都得到 UnknownSegment，不会抛出异常"""
+        if not isinstance(data, dict):
+            return UnknownSegment({})
+        segment_type = data.get("type")
+        # 列表、字典之类不可哈希的 type 不能拿去查表
+        segment_class = SEGMENT_CLASSES.get(segment_type, UnknownSegment) if isinstance(segment_type, str) else UnknownSegment
+        return segment_class(data)
 
     def __str__(self):
         raise NotImplementedError
@@ -100,20 +171,103 @@ class MessageSegment:
     def __repr__(self):
         return str(self)
     
+@register_segment(MessageSegmentType.TEXT)
 class TextSegment(MessageSegment):
     """文本片段，继承自 MessageSegment"""
+    __slots__ = ("content",)
+
     def __init__(self, raw_data: dict|str):
+        self.type = MessageSegmentType.TEXT
         if isinstance(raw_data, str):
-            raw_data = {"type": "text", "data": {"text": raw_data}}
-        super().__init__(raw_data)
+            self.data = {"text": raw_data}
+        else:
+            super().__init__(raw_data)
         self.content: str = self.data.get("text", "")
 
 
     def __str__(self):
         return self.content
-    
+
+class MediaSegment(MessageSegment):
+    """图片、视频、语音、文件等带文件的片段的公共部分"""
+    __slots__ = ("file", "url")
+
+    def __init__(self, raw_data: dict):
+        super().__init__(raw_data)
+        self.file: str = self.data.get("file", "")
+        self.url: Optional[str] = self.data.get("url")
+
+    def __str__(self):
+        return f"<{self.type.name}>"
+
+@register_segment(MessageSegmentType.IMAGE)
+class ImageSegment(MediaSegment):
+    """图片片段"""
+    __slots__ = ()
+
+@register_segment(MessageSegmentType.VIDEO)
+class VideoSegment(MediaSegment):
+    """视频片段"""
+    __slots__ = ()
+
+@register_segment(MessageSegmentType.AUDIO)
+class AudioSegment(MediaSegment):
+    """语音片段"""
+    __slots__ = ()
+
+@register_segment(MessageSegmentType.FILE)
+class FileSegment(MediaSegment):
+    """文件片段"""
+    __slots__ = ("name",)
+
+    def __init__(self, raw_data: dict):
+        super().__init__(raw_data)
+        self.name: str = self.data.get("name") or self.file
+
+    def __str__(self):
+        return f"<FILE {self.name}>"
+
+@register_segment(MessageSegmentType.REPLY)
+class ReplySegment(MessageSegment):
+    """回复片段，指向被回复的消息"""
+    __slots__ = ("message_id",)
+
+    def __init__(self, raw_data: dict):
+        super().__init__(raw_data)
+        self.message_id = self.data.get("id")
+
+    def __str__(self):
+        return f"<REPLY {self.message_id}>"
+
+@register_segment(MessageSegmentType.FACE)
+class FaceSegment(MessageSegment):
+    """QQ 表情片段"""
+    __slots__ = ("face_id",)
+
+    def __init__(self, raw_data: dict):
+        super().__init__(raw_data)
+        self.face_id = self.data.get("id")
+
+    def __str__(self):
+        return f"<FACE {self.face_id}>"
+
+@register_segment(MessageSegmentType.AT)
+class AtSegment(MessageSegment):
+    """@ 片段，qq 为 "all" 时表示 @全体成员"""
+    __slots__ = ("qq",)
+
+    def __init__(self, raw_data: dict):
+        super().__init__(raw_data)
+        self.qq = self.data.get("qq")
+
+    def __str__(self):
+        return f"@{self.qq}"
+
+@register_segment(MessageSegmentType.UNKNOWN)
 class UnknownSegment(MessageSegment):
     """未知片段，继承自 MessageSegment"""
+    __slots__ = ()
+
     def __init__(self, raw_data: dict):
         super().__init__(raw_data)
         self.type = MessageSegmentType.UNKNOWN
@@ -123,13 +277,33 @@ class UnknownSegment(MessageSegment):
 
 class Message:
     """消息类，用于表示消息的通用部分"""
-    def __init__(self, message_id: int, user_id: int, message_type: MessageType, timestamp: int, raw_message: str, segments: list[MessageSegment]):
+    __slots__ = ("message_id", "user_id", "type", "timestamp", "raw_message", "_segments", "_raw_segments")
+
+    def __init__(self, message_id: int, user_id: int, message_type: MessageType, timestamp: int, raw_message: str, segments: Optional[list[MessageSegment]]):
         self.message_id = message_id
         self.user_id = user_id
         self.type = message_type
         self.timestamp = timestamp
         self.raw_message = raw_message
-        self.segments = segments
+        self._segments = segments
+        self._raw_segments = ()  # 尚未解析的 OneBot 片段列表，第一次访问 segments 时才解析
+
+    @property
+    def segments(self) -> list[MessageSegment]:
+        if self._segments is None:
+            self._segments = [MessageSegment.from_dict(seg) for seg in self._raw_segments]
+            self._raw_segments = ()
+        return self._segments
+
+    @segments.setter
+    def segments(self, segments: list[MessageSegment]):
+        self._segments = segments
+        self._raw_segments = ()
+
+    @property
+    def conversation_key(self) -> tuple:
+        """所属会话：私聊为 ("private", user_id)，群聊为 ("group", group_id)"""
+        return (self.type.value, self.user_id)
 
     @staticmethod
     def from_dict(data: dict):
@@ -139,11 +313,20 @@ class Message:
         message_type = MessageType(data.get("message_type", "private"))
         timestamp = data.get("timestamp", 0)
         raw_message = data.get("raw_message", "")
-        segments = [MessageSegment.from_dict(seg) for seg in data.get("message", [])]
         if message_type == MessageType.PRIVATE:
-            return PrivateMessage(message_id, user_id, timestamp, raw_message, segments)
+            message = PrivateMessage(message_id, user_id, timestamp, raw_message, None)
         elif message_type == MessageType.GROUP:
-            return GroupMessage(message_id, user_id, group_id, timestamp, raw_message, segments)
+            message = GroupMessage(message_id, user_id, group_id, timestamp, raw_message, None)
+        raw_segments = data.get("message", [])
+        if isinstance(raw_segments, str):
+            # message_format 为 string 时 message 是 CQ 码字符串，整体作为一个文本片段
+            message.segments = [TextSegment(raw_segments)]
+        elif isinstance(raw_segments, list):
+            message._raw_segments = raw_segments
+        else:
+            # null 或其他格式不对的值：现在就当成没有片段，而不是等到处理函数第一次读取 segments 时才出错
+            message.segments = []
+        return message
 
     def __str__(self):
         return f"{self.type.name.capitalize()} message from {self.user_id}: {self.raw_message}"
@@ -153,19 +336,33 @@ class Message:
     
 class PrivateMessage(Message):
     """私聊消息，继承自 Message"""
+    __slots__ = ()
+
     def __init__(self, message_id: int, user_id: int, timestamp: int, raw_message: str, segments: list[MessageSegment]):
         super().__init__(message_id, user_id, MessageType.PRIVATE, timestamp, raw_message, segments)
 
 class GroupMessage(Message):
     """群聊消息，继承自 Message"""
+    __slots__ = ("group_id",)
+
     def __init__(self, message_id: int, user_id: int, group_id: int, timestamp: int, raw_message: str, segments: list[MessageSegment]):
         super().__init__(message_id, user_id, MessageType.GROUP, timestamp, raw_message, segments)
         self.group_id = group_id
 
+    @property
+    def conversation_key(self) -> tuple:
+        return (self.type.value, self.group_id)
+
 class MessageEvent(Event):
+    __slots__ = ("message",)
+
     def __init__(self, message: Message, **raw_data):
         super().__init__(**raw_data)
         self.message = message
+
+    @property
+    def partition_key(self) -> Optional[Hashable]:
+        return self.message.conversation_key
     
     @staticmethod
     def from_message(message: Message):
@@ -175,9 +372,13 @@ class MessageEvent(Event):
             return GroupMessageEvent(message)
 
 class PrivateMessageEvent(MessageEvent):
+    __slots__ = ()
+
     def __init__(self, message: PrivateMessage, **raw_data):
         super().__init__(message, **raw_data)
 
 class GroupMessageEvent(MessageEvent):
+    __slots__ = ()
+
     def __init__(self, message: GroupMessage, **raw_data):
         super().__init__(message, **raw_data)
\ No newline at end of file
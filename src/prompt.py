@@ -0,0 +1,43 @@
+import string
+from typing import Callable, Dict, List
+
+VOLATILE_FIELDS = ("current_time", "memory_summary")
+# 计算响应缓存 key 时只保留粗粒度的字段：current_time（ISO 格式）截到小时，
+# 每秒变化的时间不会让 key 都不同，问日期或时间的回答也最多沿用一小时
+COARSE_FIELDS: Dict[str, Callable[[str], str]] = {"current_time": lambda value: value[:13]}
+
+
+class PromptBuilder:
+    """
+    把提示词模板拆成不变的系统提示和每轮都会变的上下文。
+
+    模板中含有易变字段（当前时间、记忆概览）的行会被移出系统提示，拼成一条放在请求末尾的上下文消息。
+    这样系统提示和历史消息在每次请求中逐字节不变，可以命中服务端的前缀缓存。
+    """
+
+    def __init__(self, template: str, volatile_fields=VOLATILE_FIELDS, coarse_fields=COARSE_FIELDS):
+        static_lines, context_lines = [], []
+        for line in template.splitlines():
+            fields = {name for _, name, _, _ in string.Formatter().parse(line) if name}
+            (context_lines if fields & set(volatile_fields) else static_lines).append(line)
+        # 剩下的静态部分不含易变字段，format() 只负责把 {{ }} 还原
+        self.system_prompt = "\n".join(static_lines).strip().format()
+        self.context_template = "\n".join(line.strip() for line in context_lines)
+        self.system_message = {"role": "system", "content": self.system_prompt}
+        self.coarse_fields = coarse_fields
+
+    def context_message(self, **values) -> Dict[str, str]:
+        return {"role": "system", "content": self.context_template.format(**values)}
+
+    def build(self, history: List, **values) -> List:
+        """
+        组装一次请求的消息：不变的系统提示 + 历史消息 + 本轮的上下文。
+        """
+        return [self.system_message, *history, self.context_message(**values)]
+
+    def cache_messages(self, history: List, **values) -> List:
+        """
+        用来计算响应缓存 key 的消息：和 build() 相同，只是 coarse_fields 中的字段换成粗粒度的值。
+        """
+        coarse = {name: reduce(str(values[name])) for name, reduce in self.coarse_fields.items() if name in values}
+        return self.build(history, **{**values, **coarse})
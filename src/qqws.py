@@ -1,22 +1,132 @@
+import asyncio
+import re
 import websockets
 import json
-from .models import Message, MessageEvent
+from typing import List, Optional, Union
+from .models import Event, GroupMessage, Message, MessageEvent
 from .core import EventManager
 
+# 装了 orjson 就用它解码，比标准库快数倍
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+DEFAULT_URL = "ws://192.168.137.199:3001/"
+
+# 只看 post_type 字段，不做完整解码；OneBot 的 post_type 值只有小写字母
+POST_TYPE = re.compile(r'"post_type"\s*:\s*"([a-z_]+)"')
+POST_TYPE_BYTES = re.compile(rb'"post_type"\s*:\s*"([a-z_]+)"')
+
+connection = None # 当前的 WebSocket 连接，发送消息时使用
+
+# 接收统计，给 benchmark 和排查问题用
+stats = {"received": 0, "filtered": 0, "decoded": 0, "errors": 0, "batches": 0}
+
+
+def post_type(frame: Union[str, bytes]) -> Optional[str]:
+    """
+    不解码整帧，直接取出 post_type；没有该字段（例如动作的响应）时返回 None。
+    """
+    match = (POST_TYPE_BYTES if isinstance(frame, bytes) else POST_TYPE).search(frame)
+    if match is None:
+        return None
+    value = match.group(1)
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def decode_frame(frame: Union[str, bytes]) -> Optional[Event]:
+    """
+    把一帧消息解码成事件，不是消息上报时返回 None。
+    """
+    data: dict = loads(frame)
+    if data.get("post_type", "null") != "message":
+        return None
+    return MessageEvent.from_message(Message.from_dict(data))
+
+
+async def receive_frames(websocket, frames: asyncio.Queue, post_types: tuple):
+    """
+    只负责接收：用 post_type 预过滤后把原始帧放进缓冲区，解码交给 decode_frames。
+    """
+    while True:
+        frame = await websocket.recv()
+        stats["received"] += 1
+        if post_type(frame) not in post_types:
+            stats["filtered"] += 1
+            continue
+        await frames.put(frame)
+
+
+async def decode_frames(frames: asyncio.Queue, batch_size: int):
+    """
+    从缓冲区取出已积压的帧（最多 batch_size 个）一起解码，再成批交给 EventManager。收到 None 时处理完剩下的帧后退出。
+    """
+    while True:
+        batch = [await frames.get()]
+        while len(batch) < batch_size and not frames.empty():
+            batch.append(frames.get_nowait())
+        closing = batch[-1] is None
+        if closing:
+            batch.pop()
+        events: List[Event] = []
+        for frame in batch:
+            try:
+                event = decode_frame(frame)
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"无法解析的消息: {e}")
+                continue
+            if event is not None:
+                events.append(event)
+        stats["decoded"] += len(events)
+        stats["batches"] += 1
+        await EventManager.add_events(events)
+        if closing:
+            return
+
+
+async def ingest(websocket, buffer_size: int = 256, batch_size: int = 64, post_types: tuple = ("message",)):
+    """
+    在一个连接上运行接收和解码两个任务，直到连接关闭。
+
+    缓冲区满时接收端会等待，压力由 EventManager 的队列一路传回到 WebSocket。
+    """
+    frames = asyncio.Queue(buffer_size)
+    decoder = asyncio.get_running_loop().create_task(decode_frames(frames, batch_size))
+    try:
+        await receive_frames(websocket, frames, post_types)
+    except websockets.ConnectionClosed:
+        # 连接断开前收到的帧仍然要交给 EventManager
+        await frames.put(None)
+        await decoder
+        raise
+    finally:
+        decoder.cancel()
+
+
 # WebSocket 客户端逻辑
-async def listen_message():
+async def listen_message(url: str = DEFAULT_URL, buffer_size: int = 256, batch_size: int = 64):
+    global connection
     # 连接到 WebSocket 服务器
-    async with websockets.connect("ws://192.168.137.199:3001/") as websocket:
-        print("已连接到 WebSocket 服务器 ws://192.168.137.199:3001/")
+    async with websockets.connect(url, max_queue=buffer_size) as websocket:
+        print(f"已连接到 WebSocket 服务器 {url}")
+        connection = websocket
 
-        # 持续接收消息并输出
+        # 持续接收消息
         try:
-            while True:
-                message = await websocket.recv()  # 接收消息
-                data: dict = json.loads(message)
-                if data.get("post_type", "null") == "message":
-                    message = Message.from_dict(data)
-                    event = MessageEvent.from_message(message)
-                    await EventManager.add_event(event)
+            await ingest(websocket, buffer_size, batch_size)
         except websockets.ConnectionClosed:
             print("连接已关闭")
+
+# 通过 OneBot 动作回复一条消息所在的会话
+async def send_text(reply_to: Message, text: str):
+    if connection is None:
+        raise RuntimeError("WebSocket 尚未连接")
+    if isinstance(reply_to, GroupMessage):
+        action = {"action": "send_group_msg", "params": {"group_id": reply_to.group_id, "message": text}}
+    else:
+        action = {"action": "send_private_msg", "params": {"user_id": reply_to.user_id, "message": text}}
+    await connection.send(json.dumps(action, ensure_ascii=False))
@@ -0,0 +1,222 @@
+import json
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .storage import Memory
+from .tokens import estimate_tokens
+
+# 英文按字母数字切词（下划线和点都是分隔符），中日韩文字按单字切分后再组成二元组
+WORD = re.compile(r"[a-z0-9]+|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+LATIN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分成检索用的词项。
+    """
+    terms = []
+    for word in WORD.findall(text.lower()):
+        if LATIN.fullmatch(word):
+            terms.append(word)
+        else:
+            terms.extend(word)
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+def memory_text(memory: Memory) -> str:
+    """
+    参与检索的文本：key 加上所有值。
+    """
+    values = (value if isinstance(value, str) else json.dumps(value, ensure_ascii=False) for value in memory.value)
+    return " ".join((memory.key, *values))
+
+
+def render_memory(memory: Memory) -> dict:
+    """
+    注入到提示词中的精简形式，不带时间戳。
+    """
+    return {"key": memory.key, "value": list(memory.value)}
+
+
+class MemoryIndex:
+    """
+    记忆的本地检索索引：BM25 词项匹配加上特征哈希得到的稠密向量，打分用 NumPy 向量化完成。
+
+    索引按行存储，删除的行会被复用；add / remove 都是增量的，不需要重建。
+    """
+
+    def __init__(self, dim: int = 256, k1: float = 1.2, b: float = 0.75, embedding_weight: float = 0.5):
+        self.dim = dim
+        self.k1 = k1
+        self.b = b
+        self.embedding_weight = embedding_weight
+        self.rows: Dict[str, int] = {}  # key -> 行号
+        self.keys: List[Optional[str]] = []  # 行号 -> key
+        self.terms: List[Optional[Counter]] = []  # 行号 -> 词频，删除时用来清理倒排表
+        self.free: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}  # 词项 -> {行号: 词频}
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def embed(self, terms: Iterable[str]) -> np.ndarray:
+        """
+        特征哈希：每个词项和英文词的字符三元组按 crc32 映射到一个维度和符号，最后做 L2 归一化。
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term in terms:
+            features = [term]
+            if LATIN.fullmatch(term) and len(term) > 3:
+                padded = f"#{term}#"
+                features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+            for feature in features:
+                h = zlib.crc32(feature.encode())
+                vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def grow(self):
+        size = max(64, len(self.keys) * 2)
+        self.lengths = np.resize(self.lengths, size)
+        self.alive = np.concatenate([self.alive, np.zeros(size - len(self.alive), dtype=bool)])
+        vectors = np.zeros((size, self.dim), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+        self.vectors = vectors
+
+    def add(self, memory: Memory):
+        """
+        加入或更新一条记忆。
+        """
+        self.remove(memory.key)
+        terms = tokenize(memory_text(memory))
+        counts = Counter(terms)
+        if self.free:
+            row = self.free.pop()
+            self.keys[row] = memory.key
+            self.terms[row] = counts
+        else:
+            row = len(self.keys)
+            self.keys.append(memory.key)
+            self.terms.append(counts)
+            if row >= len(self.alive):
+                self.grow()
+        self.rows[memory.key] = row
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[row] = count
+        self.lengths[row] = len(terms)
+        self.vectors[row] = self.embed(terms)
+        self.alive[row] = True
+        self.total_length += len(terms)
+
+    def remove(self, key: str):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        for term in self.terms[row]:
+            posting = self.postings[term]
+            del posting[row]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= int(self.lengths[row])
+        self.keys[row] = None
+        self.terms[row] = None
+        self.alive[row] = False
+        self.vectors[row] = 0
+        self.free.append(row)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        返回每一行的相关度，已删除的行为 -inf。
+        """
+        size = len(self.keys)
+        terms = tokenize(query)
+        bm25 = np.zeros(size, dtype=np.float32)
+        if self.rows:
+            count = len(self.rows)
+            avg_length = self.total_length / count or 1.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[:size] / avg_length)
+            for term, weight in Counter(terms).items():
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                rows = np.fromiter(posting.keys(), dtype=np.int64, count=len(posting))
+                tf = np.fromiter(posting.values(), dtype=np.float32, count=len(posting))
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                bm25[rows] += weight * idf * tf * (self.k1 + 1) / (tf + norm[rows])
+        top = bm25.max(initial=0.0)
+        if top > 0:
+            bm25 /= top
+        scores = bm25 + self.embedding_weight * (self.vectors[:size] @ self.embed(terms))
+        scores[~self.alive[:size]] = -np.inf
+        return scores
+
+    def search(self, query: str, top_k: int = 20) -> List[Tuple[str, float]]:
+        """
+        返回最相关的 top_k 个 (key, score)，按相关度从高到低排列。
+        """
+        if not self.rows:
+            return []
+        scores = self.scores(query)
+        k = min(top_k, len(self.rows))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.keys[row], float(scores[row])) for row in candidates]
+
+
+def render_tree(memories: Iterable[Memory], timestamps: bool = False) -> dict:
+    """
+    紧凑渲染：按 key 的点分段嵌套，共享的前缀只出现一次，默认不带时间戳。
+    一个 key 同时又是别的 key 的前缀时，它自己的值放在 "_value" 下；已经有子 key 叫 "_value" 时
+    在前面多加下划线，直到不冲突为止。
+    """
+    root: dict = {}  # 段 -> [值, 子节点]
+    for memory in memories:
+        children = root
+        *parents, leaf = memory.key.split(".")
+        for segment in parents:
+            children = children.setdefault(segment, [None, {}])[1]
+        value = list(memory.value)
+        if timestamps:
+            value = {"value": value, "created_at": memory.created_at, "modified_at": memory.modified_at}
+        children.setdefault(leaf, [None, {}])[0] = value
+
+    def build(children: dict) -> dict:
+        tree = {}
+        for segment, (value, grandchildren) in children.items():
+            if not grandchildren:
+                tree[segment] = value
+            else:
+                tree[segment] = build(grandchildren)
+                if value is not None:
+                    own = "_value"
+                    while own in grandchildren:
+                        own = "_" + own
+                    tree[segment][own] = value
+        return tree
+
+    return build(root)
+
+
+def fit_budget(memories: Iterable[Memory], token_budget: int) -> List[Memory]:
+    """
+    按顺序挑选记忆，直到渲染后的大小用完 token 预算；放不下的条目跳过，继续尝试后面更短的。
+    """
+    selected = []
+    used = 0
+    for memory in memories:
+        cost = estimate_tokens(json.dumps(render_memory(memory), ensure_ascii=False))
+        if used + cost > token_budget:
+            continue
+        selected.append(memory)
+        used += cost
+    return selected
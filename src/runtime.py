@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Optional
+
+from .agent import MemoryManager, load_prompt_builder, reply_publisher, run_turn
+from .history import ConversationHistory
+from .models import GroupMessage, Message, MessageEvent
+from .prompt import PromptBuilder
+from .storage import MemoryStorage, NamespacedStorage, open_storage
+
+
+def session_key(message: Message) -> str:
+    """
+    私聊按 user_id、群聊按 group_id 划分会话，同时用作记忆的命名空间。
+    """
+    kind, id = message.conversation_key
+    return f"{kind}.{id}"
+
+
+class Session:
+    """
+    一个 QQ 会话的状态：对话历史和独立命名空间下的记忆。
+    """
+
+    def __init__(self, key: str, memory_manager: MemoryManager, history: ConversationHistory):
+        self.key = key
+        self.memory_manager = memory_manager
+        self.history = history
+        self.lock = asyncio.Lock()  # 同一会话的轮次依次执行
+
+
+class AgentRuntime:
+    """
+    多会话运行时：每个私聊用户或群各有一个 Session，活跃的会话放在 LRU 缓存里。
+
+    会话数超过 max_sessions，或所有会话的历史估算 token 数之和超过 max_history_tokens 时，
+    最久未使用的空闲会话被写到 sessions_dir 并移出内存，下次收到消息时再从磁盘加载。
+    记忆都存放在同一个底层存储中，按会话分命名空间。
+    """
+
+    def __init__(
+        self,
+        storage: Optional[MemoryStorage] = None,
+        sessions_dir: str = "sessions",
+        max_sessions: int = 256,
+        max_history_tokens: int = 2_000_000,
+        prompt_builder: Optional[PromptBuilder] = None,
+        history_budget: int = 6000,
+    ):
+        self.storage = storage if storage is not None else open_storage("memories.db")
+        self.sessions_dir = sessions_dir
+        self.max_sessions = max_sessions
+        self.max_history_tokens = max_history_tokens
+        self.prompt_builder = prompt_builder or load_prompt_builder()
+        self.history_budget = history_budget
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        os.makedirs(sessions_dir, exist_ok=True)
+
+    def session_path(self, key: str) -> str:
+        return os.path.join(self.sessions_dir, f"{key}.json")
+
+    def get_session(self, key: str) -> Session:
+        session = self.sessions.get(key)
+        if session is not None:
+            self.sessions.move_to_end(key)
+            return session
+        history = ConversationHistory(token_budget=self.history_budget)
+        try:
+            with open(self.session_path(key), "r", encoding='utf-8') as file:
+                history.load_dict(json.load(file))
+        except FileNotFoundError:
+            pass
+        session = Session(key, MemoryManager(storage=NamespacedStorage(self.storage, key)), history)
+        self.sessions[key] = session
+        # 新会话还没拿到锁，不能把它自己当成空闲会话移除
+        self.evict(keep=key)
+        return session
+
+    def save_session(self, session: Session):
+        """
+        把会话历史原子地写到磁盘，记忆已经在共享存储里，只需要落盘。
+        """
+        session.memory_manager.flush()
+        fd, tmp_path = tempfile.mkstemp(prefix=".session-", suffix=".tmp", dir=self.sessions_dir)
+        try:
+            with os.fdopen(fd, "w", encoding='utf-8') as file:
+                json.dump(session.history.to_dict(), file, ensure_ascii=False)
+            os.replace(tmp_path, self.session_path(session.key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def history_tokens(self) -> int:
+        return sum(session.history.total_tokens for session in self.sessions.values())
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        按 LRU 顺序写出并移除空闲会话，直到回到限制以内；正在处理消息的会话和 keep 指定的会话不会被移除。
+        """
+        for key in list(self.sessions):
+            if len(self.sessions) <= self.max_sessions and self.history_tokens() <= self.max_history_tokens:
+                break
+            session = self.sessions[key]
+            if key == keep or session.lock.locked() or session.history.summary_tasks:
+                continue
+            self.save_session(session)
+            del self.sessions[key]
+            logging.info(f"Evicted session {key}")
+
+    async def handle(self, event: MessageEvent):
+        """
+        处理一条消息：在对应的会话中跑一轮对话，回复按句作为 PartialReplyEvent 发布。
+        """
+        message = event.message
+        session = self.get_session(session_key(message))
+        text = message.raw_message
+        if isinstance(message, GroupMessage):
+            # 群聊中需要知道是谁在说话
+            text = f"[{message.user_id}] {text}"
+        async with session.lock:
+            response = await run_turn(
+                text,
+                session.memory_manager,
+                self.prompt_builder,
+                session.history,
+                on_text=reply_publisher(message),
+                session=session.key,
+            )
+        self.evict()
+        return response
+
+    async def close(self):
+        """
+        等待摘要任务结束，写出全部会话并关闭存储。
+        """
+        for session in list(self.sessions.values()):
+            await session.history.wait()
+            self.save_session(session)
+        self.sessions.clear()
+        self.storage.close()
@@ -0,0 +1,637 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
+
+
+class Memory:
+    def __init__(self, key: str, value: Set[Union[str, dict, list, tuple]], created_at: Optional[str] = None, modified_at: Optional[str] = None):
+        """
+        初始化记忆对象。
+        """
+        self.key = key
+        self.value = value
+        self.created_at = created_at or datetime.now().isoformat()
+        self.modified_at = modified_at or datetime.now().isoformat()
+
+    def to_dict(self):
+        """
+        将记忆对象转换为字典格式。
+        """
+        return {
+            "key": self.key,
+            "value": list(self.value),
+            "created_at": self.created_at,
+            "modified_at": self.modified_at
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Memory":
+        """
+        从字典格式还原记忆对象。
+        """
+        return Memory(
+            key=data["key"],
+            value=set(data["value"]),
+            created_at=data.get("created_at"),
+            modified_at=data.get("modified_at")
+        )
+
+
+def key_prefix(key: str) -> str:
+    """
+    返回点分 key 的上一级命名空间，例如 user.watched_movies -> user。
+    """
+    return key.rpartition(".")[0]
+
+
+class TrieNode:
+    __slots__ = ("children", "terminal", "count")
+
+    def __init__(self):
+        self.children: Dict[str, "TrieNode"] = {}
+        self.terminal = False  # 这个节点本身是否对应一个已存的 key
+        self.count = 0  # 这棵子树（含节点本身）中的 key 数
+
+
+class KeyTrie:
+    """
+    按点分段组织 key 的前缀树，前缀查询和子树删除只需访问对应的子树。
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.root = TrieNode()
+        self.size = 0
+        for key in keys:
+            self.add(key)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def find(self, prefix: str) -> Optional[TrieNode]:
+        node = self.root
+        for segment in prefix.split(".") if prefix else ():
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def add(self, key: str):
+        path = [self.root]
+        for segment in key.split("."):
+            path.append(path[-1].children.setdefault(segment, TrieNode()))
+        if not path[-1].terminal:
+            path[-1].terminal = True
+            self.size += 1
+            for node in path:
+                node.count += 1
+
+    def remove(self, key: str) -> bool:
+        path = [self.root]
+        segments = key.split(".")
+        for segment in segments:
+            node = path[-1].children.get(segment)
+            if node is None:
+                return False
+            path.append(node)
+        if not path[-1].terminal:
+            return False
+        path[-1].terminal = False
+        self.size -= 1
+        for node in path:
+            node.count -= 1
+        # 自底向上清理已经空了的节点
+        for segment, parent, node in zip(reversed(segments), reversed(path[:-1]), reversed(path)):
+            if node.terminal or node.children:
+                break
+            del parent.children[segment]
+        return True
+
+    def count(self, prefix: str = "") -> int:
+        """
+        prefix 本身及其下所有层级的 key 数，不需要遍历子树。
+        """
+        node = self.find(prefix)
+        return node.count if node is not None else 0
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """
+        列出 prefix 本身及其下所有层级的 key，空前缀表示全部。
+        """
+        node = self.find(prefix)
+        if node is None:
+            return []
+        keys = []
+        stack = [(prefix, node)]
+        while stack:
+            path, node = stack.pop()
+            if node.terminal:
+                keys.append(path)
+            for segment, child in node.children.items():
+                stack.append((f"{path}.{segment}" if path else segment, child))
+        return keys
+
+    def remove_prefix(self, prefix: str) -> List[str]:
+        """
+        删除整棵子树，返回被删除的 key。
+        """
+        keys = self.keys(prefix)
+        for key in keys:
+            self.remove(key)
+        return keys
+
+
+class MemoryStorage:
+    """
+    记忆存储后端的接口。put 之前记忆可能已被原地修改，后端需要以 put 时的状态为准。
+    """
+
+    def get(self, key: str) -> Optional[Memory]:
+        raise NotImplementedError
+
+    def put(self, memory: Memory):
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def keys(self) -> List[str]:
+        raise NotImplementedError
+
+    def values(self) -> Iterator[Memory]:
+        raise NotImplementedError
+
+    def with_prefix(self, prefix: str) -> Iterator[Memory]:
+        """
+        列出 key 等于 prefix 或位于 prefix 命名空间下（包括更深的层级）的所有记忆。
+        """
+        raise NotImplementedError
+
+    def count_prefix(self, prefix: str) -> int:
+        """
+        with_prefix(prefix) 会列出的记忆条数，后端应在不加载记忆的情况下给出。
+        """
+        return sum(1 for _ in self.with_prefix(prefix))
+
+    def delete_prefix(self, prefix: str) -> List[str]:
+        """
+        删除整个命名空间，返回被删除的 key。
+        """
+        keys = [memory.key for memory in self.with_prefix(prefix)]
+        with self.batch():
+            for key in keys:
+                self.delete(key)
+        return keys
+
+    def modified_since(self, timestamp: str) -> Iterator[Memory]:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def flush(self):
+        pass
+
+    @contextmanager
+    def batch(self):
+        """
+        在 with 块内合并多次修改，退出时统一落盘。
+        """
+        yield self
+        self.flush()
+
+    def close(self):
+        self.flush()
+
+
+class JsonStorage(MemoryStorage):
+    """
+    JSON 文件后端：全部记忆常驻内存，快照文件加追加式日志。
+
+    每次修改只追加一行到日志文件 journal_path（默认为 file_path + ".journal"），
+    日志超过快照大小的 compact_ratio 倍（且至少有 compact_every 条）时再把全部记忆压缩写回快照，
+    这样重写快照的开销按写入量摊销，不随记忆条数增长。
+    write_behind 为 True 时修改只缓存在内存中，直到调用 flush()。
+    """
+
+    def __init__(self, file_path: str = "memories.json", journal_path: Optional[str] = None, compact_every: int = 200, compact_ratio: float = 0.5, write_behind: bool = False):
+        self.file_path = file_path
+        self.journal_path = journal_path or file_path + ".journal"
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        self.write_behind = write_behind
+        self.batch_depth = 0  # 当前打开的 batch 数，多个会话的 batch 可能交错
+        self.memories: Dict[str, Memory] = {}
+        self.trie = KeyTrie()
+        self.pending: List[str] = []  # 尚未写入日志的修改
+        self.journal_size = 0  # 日志中的条数
+        self.journal_bytes = 0  # 日志文件的字节数
+        self.snapshot_bytes = 0  # 快照文件的字节数
+        self.journal_file = None
+        self.load_memories()
+
+    def get(self, key: str) -> Optional[Memory]:
+        return self.memories.get(key)
+
+    def put(self, memory: Memory):
+        self.memories[memory.key] = memory
+        self.trie.add(memory.key)
+        self.record({"op": "save", "memory": memory.to_dict()})
+
+    def delete(self, key: str) -> bool:
+        if key not in self.memories:
+            return False
+        del self.memories[key]
+        self.trie.remove(key)
+        self.record({"op": "delete", "key": key})
+        return True
+
+    def keys(self) -> List[str]:
+        return list(self.memories)
+
+    def values(self) -> Iterator[Memory]:
+        return iter(list(self.memories.values()))
+
+    def with_prefix(self, prefix: str) -> Iterator[Memory]:
+        return iter([self.memories[key] for key in sorted(self.trie.keys(prefix))])
+
+    def count_prefix(self, prefix: str) -> int:
+        return self.trie.count(prefix)
+
+    def delete_prefix(self, prefix: str) -> List[str]:
+        keys = self.trie.remove_prefix(prefix)
+        with self.batch():
+            for key in keys:
+                del self.memories[key]
+                self.record({"op": "delete", "key": key})
+        return keys
+
+    def modified_since(self, timestamp: str) -> Iterator[Memory]:
+        return (memory for memory in list(self.memories.values()) if memory.modified_at >= timestamp)
+
+    def __len__(self) -> int:
+        return len(self.memories)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.memories
+
+    def record(self, entry: dict):
+        """
+        记录一次修改。日志条目保存修改后的完整状态，重放时可以直接覆盖。
+        """
+        self.pending.append(json.dumps(entry, ensure_ascii=False))
+        if not self.write_behind and not self.batch_depth:
+            self.flush()
+
+    def flush(self):
+        """
+        把缓存的修改追加到日志并 fsync 一次，必要时压缩成快照。
+        """
+        if not self.pending:
+            return
+        if self.journal_file is None:
+            self.journal_file = open(self.journal_path, "a", encoding='utf-8')
+        self.journal_file.write("\n".join(self.pending) + "\n")
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.journal_size += len(self.pending)
+        self.journal_bytes = self.journal_file.tell()
+        self.pending.clear()
+        if self.journal_size >= self.compact_every and self.journal_bytes >= self.compact_ratio * self.snapshot_bytes:
+            self.compact()
+
+    @contextmanager
+    def batch(self):
+        """
+        在 with 块内暂时启用 write-behind，退出时统一落盘，例如把一轮 LLM 的多个工具调用合并成一次 fsync。
+        用计数而不是保存再恢复 write_behind，几个会话的 batch 跨 await 交错时也不会把它永久留成 True。
+        """
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            self.flush()
+
+    def compact(self):
+        """
+        把全部记忆写成快照，然后清空日志。
+        """
+        self.pending.clear()
+        self.save_memories()
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+        open(self.journal_path, "w").close()
+        self.journal_size = 0
+        self.journal_bytes = 0
+
+    def close(self):
+        self.flush()
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+    def save_memories(self):
+        """
+        将记忆保存到本地文件。先写临时文件再原子替换，写到一半崩溃也不会损坏原文件。
+        """
+        memories_data = {key: memory.to_dict() for key, memory in self.memories.items()}
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".memories-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding='utf-8') as file:
+                json.dump(memories_data, file, ensure_ascii=False)
+                file.flush()
+                os.fsync(file.fileno())
+                self.snapshot_bytes = os.fstat(file.fileno()).st_size
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logging.info(f"Memories saved to {self.file_path}")
+
+    def load_memories(self):
+        """
+        从本地文件加载记忆：先读快照，再重放日志中的修改。
+        """
+        try:
+            with open(self.file_path, "r", encoding='utf-8') as file:
+                memories_data = json.load(file)
+                for key, data in memories_data.items():
+                    self.memories[key] = Memory.from_dict(data)
+                self.snapshot_bytes = os.fstat(file.fileno()).st_size
+            logging.info(f"Memories loaded from {self.file_path}")
+        except FileNotFoundError:
+            logging.warning(f"No memory file found at {self.file_path}. Starting with an empty memory manager.")
+        try:
+            with open(self.journal_path, "rb") as file:
+                valid_size = 0
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时最后一行可能只写了一半，截掉它，避免后续追加接在残行后面
+                        logging.warning(f"Dropping truncated journal entry in {self.journal_path}")
+                        break
+                    if entry["op"] == "save":
+                        self.memories[entry["memory"]["key"]] = Memory.from_dict(entry["memory"])
+                    elif entry["op"] == "delete":
+                        self.memories.pop(entry["key"], None)
+                    self.journal_size += 1
+                    valid_size += len(line)
+            if valid_size < os.path.getsize(self.journal_path):
+                os.truncate(self.journal_path, valid_size)
+            self.journal_bytes = valid_size
+            logging.info(f"Replayed {self.journal_size} journal entries from {self.journal_path}")
+        except FileNotFoundError:
+            pass
+        self.trie = KeyTrie(self.memories)
+
+
+class SQLiteStorage(MemoryStorage):
+    """
+    SQLite 后端（WAL 模式）：按需加载记忆，只在内存中保留最近访问的 cache_size 条。
+
+    key 是主键，上一级命名空间 prefix 和 modified_at 各有索引；
+    with_prefix / delete_prefix 用主键上的范围查询，任意深度的子命名空间都能走索引。
+    """
+
+    def __init__(self, file_path: str = "memories.db", cache_size: int = 1024):
+        self.file_path = file_path
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, Memory]" = OrderedDict()
+        self.batch_depth = 0  # 共用当前事务的 batch 数
+        self.batch_joined = 0  # 这个事务开始以来进入过的 batch 数
+        # 由我们自己控制事务，batch 内的修改只提交一次
+        self.connection = sqlite3.connect(file_path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS memories (
+                key TEXT PRIMARY KEY,
+                prefix TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                modified_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS memories_prefix ON memories (prefix);
+            CREATE INDEX IF NOT EXISTS memories_modified_at ON memories (modified_at);
+            """
+        )
+
+    def remember(self, memory: Memory):
+        self.cache[memory.key] = memory
+        self.cache.move_to_end(memory.key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    @staticmethod
+    def from_row(row) -> Memory:
+        key, value, created_at, modified_at = row
+        return Memory(key, set(json.loads(value)), created_at, modified_at)
+
+    def get(self, key: str) -> Optional[Memory]:
+        memory = self.cache.get(key)
+        if memory is not None:
+            self.cache.move_to_end(key)
+            return memory
+        row = self.connection.execute(
+            "SELECT key, value, created_at, modified_at FROM memories WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        memory = self.from_row(row)
+        self.remember(memory)
+        return memory
+
+    def put(self, memory: Memory):
+        self.remember(memory)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO memories (key, prefix, value, created_at, modified_at) VALUES (?, ?, ?, ?, ?)",
+            (memory.key, key_prefix(memory.key), json.dumps(list(memory.value), ensure_ascii=False), memory.created_at, memory.modified_at),
+        )
+
+    def delete(self, key: str) -> bool:
+        self.cache.pop(key, None)
+        return self.connection.execute("DELETE FROM memories WHERE key = ?", (key,)).rowcount > 0
+
+    def keys(self) -> List[str]:
+        return [row[0] for row in self.connection.execute("SELECT key FROM memories ORDER BY key")]
+
+    def query(self, where: str = "", params: tuple = ()) -> Iterator[Memory]:
+        cursor = self.connection.execute(f"SELECT key, value, created_at, modified_at FROM memories {where}", params)
+        for row in cursor:
+            memory = self.cache.get(row[0])
+            yield memory if memory is not None else self.from_row(row)
+
+    def values(self) -> Iterator[Memory]:
+        return self.query("ORDER BY key")
+
+    def with_prefix(self, prefix: str) -> Iterator[Memory]:
+        # "." 的下一个字符是 "/"，[prefix., prefix/) 恰好是这个命名空间
+        return self.query("WHERE key = ? OR (key >= ? AND key < ?) ORDER BY key", (prefix, prefix + ".", prefix + "/"))
+
+    def count_prefix(self, prefix: str) -> int:
+        params = (prefix, prefix + ".", prefix + "/")
+        return self.connection.execute("SELECT COUNT(*) FROM memories WHERE key = ? OR (key >= ? AND key < ?)", params).fetchone()[0]
+
+    def delete_prefix(self, prefix: str) -> List[str]:
+        params = (prefix, prefix + ".", prefix + "/")
+        keys = [row[0] for row in self.connection.execute("SELECT key FROM memories WHERE key = ? OR (key >= ? AND key < ?)", params)]
+        self.connection.execute("DELETE FROM memories WHERE key = ? OR (key >= ? AND key < ?)", params)
+        for key in keys:
+            self.cache.pop(key, None)
+        return keys
+
+    def modified_since(self, timestamp: str) -> Iterator[Memory]:
+        return self.query("WHERE modified_at >= ? ORDER BY modified_at", (timestamp,))
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.cache:
+            return True
+        return self.connection.execute("SELECT 1 FROM memories WHERE key = ?", (key,)).fetchone() is not None
+
+    def flush(self):
+        """
+        在 batch 内调用时提前提交当前事务，之后的修改进入新的事务。
+        """
+        if self.batch_depth:
+            self.connection.execute("COMMIT")
+            self.connection.execute("BEGIN")
+
+    @contextmanager
+    def batch(self):
+        """
+        把 with 块内的修改放在一个事务里，只提交（同步）一次。
+        同时打开的 batch（嵌套，或者几个会话跨 await 交错）共用一个事务，最后一个退出时提交。
+        """
+        if not self.batch_depth:
+            self.connection.execute("BEGIN")
+            self.batch_joined = 0
+        self.batch_depth += 1
+        self.batch_joined += 1
+        rollback = False
+        try:
+            yield self
+        except BaseException:
+            # 别的 batch 也在这个事务里写过时不能回滚，否则会连带丢掉它们的修改
+            rollback = self.batch_joined == 1
+            raise
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                if rollback:
+                    self.connection.execute("ROLLBACK")
+                    self.cache.clear()
+                else:
+                    self.connection.execute("COMMIT")
+
+    def close(self):
+        self.connection.close()
+
+
+class NamespacedStorage(MemoryStorage):
+    """
+    共享存储中的一个命名空间视图：key 在底层存储里带上 namespace 前缀，对使用者透明。
+    多个会话可以共用一个底层存储，各自只看到自己的记忆。
+    """
+
+    def __init__(self, storage: MemoryStorage, namespace: str):
+        self.storage = storage
+        self.namespace = namespace
+        self.prefix = namespace + "."
+
+    def outer(self, memory: Memory) -> Memory:
+        return Memory(memory.key[len(self.prefix):], memory.value, memory.created_at, memory.modified_at)
+
+    def get(self, key: str) -> Optional[Memory]:
+        memory = self.storage.get(self.prefix + key)
+        return self.outer(memory) if memory is not None else None
+
+    def put(self, memory: Memory):
+        self.storage.put(Memory(self.prefix + memory.key, memory.value, memory.created_at, memory.modified_at))
+
+    def delete(self, key: str) -> bool:
+        return self.storage.delete(self.prefix + key)
+
+    def keys(self) -> List[str]:
+        return [memory.key for memory in self.values()]
+
+    def values(self) -> Iterator[Memory]:
+        return (self.outer(memory) for memory in self.storage.with_prefix(self.namespace) if memory.key != self.namespace)
+
+    def with_prefix(self, prefix: str) -> Iterator[Memory]:
+        return (self.outer(memory) for memory in self.storage.with_prefix(self.prefix + prefix))
+
+    def count_prefix(self, prefix: str) -> int:
+        return self.storage.count_prefix(self.prefix + prefix)
+
+    def delete_prefix(self, prefix: str) -> List[str]:
+        return [key[len(self.prefix):] for key in self.storage.delete_prefix(self.prefix + prefix)]
+
+    def modified_since(self, timestamp: str) -> Iterator[Memory]:
+        return (self.outer(memory) for memory in self.storage.modified_since(timestamp) if memory.key.startswith(self.prefix))
+
+    def __len__(self) -> int:
+        # 底层的前缀计数包括 key 恰好等于 namespace 的记忆，它不属于这个视图
+        return self.storage.count_prefix(self.namespace) - (self.namespace in self.storage)
+
+    def flush(self):
+        self.storage.flush()
+
+    def batch(self):
+        return self.storage.batch()
+
+    def close(self):
+        # 底层存储由创建它的一方负责关闭
+        self.storage.flush()
+
+
+def open_storage(path: str, **kwargs) -> MemoryStorage:
+    """
+    按文件扩展名选择后端：.db / .sqlite / .sqlite3 使用 SQLite，其余使用 JSON。
+    """
+    if os.path.splitext(path)[1] in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteStorage(path, **kwargs)
+    return JsonStorage(path, **kwargs)
+
+
+def copy_memories(source: MemoryStorage, target: MemoryStorage) -> int:
+    """
+    把 source 中的全部记忆复制到 target，返回复制的条数。
+    """
+    count = 0
+    with target.batch():
+        for memory in source.values():
+            target.put(memory)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    # 在 JSON 和 SQLite 之间导入导出，例如 python -m src.storage memories.json memories.db
+    parser = argparse.ArgumentParser(description="Copy memories between storage backends.")
+    parser.add_argument("source", help="source file (.json or .db)")
+    parser.add_argument("target", help="target file (.json or .db)")
+    args = parser.parse_args()
+    source, target = open_storage(args.source), open_storage(args.target)
+    count = copy_memories(source, target)
+    if isinstance(target, JsonStorage):
+        target.compact()
+    source.close()
+    target.close()
+    print(f"Copied {count} memories from {args.source} to {args.target}")
@@ -0,0 +1,13 @@
+import math
+import re
+
+# 中日韩字符大致一个字一个 token，其余文本大致四个字符一个 token
+CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    在本地粗略估算文本的 token 数，不需要调用分词器。
+    """
+    cjk = len(CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
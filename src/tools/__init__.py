@@ -0,0 +1,214 @@
+import asyncio
+import inspect
+import json
+import logging
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Python 类型 -> JSON Schema 类型
+JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    tuple: "array",
+    dict: "object",
+    type(None): "null",
+}
+
+# JSON Schema 类型 -> 校验时接受的 Python 类型（json.loads 的结果）
+PYTHON_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+def type_schema(annotation) -> dict:
+    """
+    根据类型注解生成 JSON Schema，支持基本类型、List[X]、Dict、Union / Optional。
+    """
+    if annotation is inspect.Parameter.empty or annotation is Any:
+        return {}
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union or (origin is not None and origin.__class__.__name__ == "UnionType"):
+        options = [type_schema(arg) for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(options) == 1:
+            return options[0]
+        if all(set(option) == {"type"} for option in options):
+            return {"type": [option["type"] for option in options]}
+        return {"anyOf": options}
+    if origin in (list, tuple, set):
+        args = typing.get_args(annotation)
+        schema = {"type": "array"}
+        if args and args[0] is not Ellipsis:
+            schema["items"] = type_schema(args[0])
+        return schema
+    if origin is dict:
+        return {"type": "object"}
+    if annotation in JSON_TYPES:
+        return {"type": JSON_TYPES[annotation]}
+    raise TypeError(f"unsupported annotation for a tool parameter: {annotation!r}")
+
+
+def compile_type_check(schema: dict) -> Callable[[Any], bool]:
+    """
+    把一个参数的 schema 预编译成校验函数，只检查类型（包括数组元素的类型）。
+    """
+    if "anyOf" in schema:
+        checks = [compile_type_check(option) for option in schema["anyOf"]]
+        return lambda value: any(check(value) for check in checks)
+    if "type" not in schema:
+        return lambda value: True
+    names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    accepted = tuple(t for name in names for t in PYTHON_TYPES[name])
+    # JSON 中的 true / false 会被解析成 bool，而 bool 是 int 的子类
+    reject_bool = "boolean" not in names
+    item_check = compile_type_check(schema["items"]) if "items" in schema else None
+
+    def check(value) -> bool:
+        if not isinstance(value, accepted) or (reject_bool and isinstance(value, bool)):
+            return False
+        if item_check is not None and isinstance(value, list):
+            return all(item_check(item) for item in value)
+        return True
+
+    return check
+
+
+def describe(schema: dict) -> str:
+    """
+    给错误信息用的类型描述，例如 "array of string | object | array"。
+    """
+    if "anyOf" in schema:
+        return " or ".join(describe(option) for option in schema["anyOf"])
+    names = schema.get("type", "any")
+    text = " | ".join(names) if isinstance(names, list) else names
+    if "items" in schema:
+        text += f" of {describe(schema['items'])}"
+    return text
+
+
+class Tool:
+    """
+    一个可供 LLM 调用的工具：schema 和参数校验函数在注册时生成一次，之后每次调用直接复用。
+    """
+
+    def __init__(self, func: Callable, name: str, description: str, params: Dict[str, str], context: Tuple[str, ...], batched: bool):
+        self.func = func
+        self.name = name
+        self.description = description
+        self.context = context
+        self.batched = batched
+        self.is_async = inspect.iscoroutinefunction(func)
+        properties = {}
+        required = []
+        self.checks: Dict[str, Tuple[Callable[[Any], bool], str]] = {}
+        hints = typing.get_type_hints(func)
+        for parameter in inspect.signature(func).parameters.values():
+            if parameter.name in context:
+                continue
+            schema = type_schema(hints.get(parameter.name, parameter.annotation))
+            if parameter.name in params:
+                schema["description"] = params[parameter.name]
+            if parameter.default is inspect.Parameter.empty:
+                required.append(parameter.name)
+            else:
+                schema["default"] = parameter.default
+            properties[parameter.name] = schema
+            self.checks[parameter.name] = (compile_type_check(schema), describe(schema))
+        self.required = tuple(required)
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": description,
+                "parameters": {"type": "object", "properties": properties, "required": required},
+            },
+        }
+
+    def validate(self, args) -> Optional[str]:
+        """
+        校验参数，合法时返回 None，否则返回给 LLM 看的错误说明。
+        """
+        if not isinstance(args, dict):
+            return "arguments must be a JSON object"
+        missing = [name for name in self.required if name not in args]
+        if missing:
+            return f"missing required argument(s): {', '.join(missing)}"
+        for name, value in args.items():
+            entry = self.checks.get(name)
+            if entry is None:
+                return f"unexpected argument: {name}"
+            check, expected = entry
+            if not check(value):
+                return f"argument '{name}' must be {expected}, got {json.dumps(value, ensure_ascii=False)}"
+        return None
+
+
+class ToolRegistry:
+    def __init__(self):
+        self.tools: Dict[str, Tool] = {}
+        self._schemas: Optional[List[dict]] = None
+
+    def register(self, name: Optional[str] = None, description: str = "", params: Optional[Dict[str, str]] = None, context: Tuple[str, ...] = (), batched: bool = False):
+        """
+        注册工具的装饰器。
+
+        params 是参数说明；context 中的参数不会出现在 schema 里，而是在调用时由调用方传入（例如 memory_manager）；
+        batched 表示工具只修改内存中的状态，可以在事件循环里直接执行并共用一轮结束时的一次落盘。
+        """
+        def decorator(func):
+            tool = Tool(func, name or func.__name__, description, params or {}, tuple(context), batched)
+            self.tools[tool.name] = tool
+            self._schemas = None
+            return func
+        return decorator
+
+    def schemas(self) -> List[dict]:
+        """
+        发送给 LLM 的 tools 列表，注册表不变时总是返回同一个对象。
+        """
+        if self._schemas is None:
+            self._schemas = [tool.schema for tool in self.tools.values()]
+        return self._schemas
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self.tools.get(name)
+
+    async def call(self, name: str, arguments: str, **context) -> dict:
+        """
+        解析并校验参数后调用工具。参数不合法时直接返回错误，不会执行工具。
+        """
+        tool = self.tools.get(name)
+        if tool is None:
+            return {"status": "error", "message": f"Unknown function: {name}"}
+        try:
+            args = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            return {"status": "error", "message": f"arguments are not valid JSON: {e}"}
+        error = tool.validate(args)
+        if error is not None:
+            return {"status": "error", "message": error}
+        logging.warning(f"Calling function: {name} with args: {args}")
+        kwargs = {key: context[key] for key in tool.context}
+        try:
+            if tool.is_async:
+                return await tool.func(**kwargs, **args)
+            if tool.batched:
+                return tool.func(**kwargs, **args)
+            return await asyncio.to_thread(tool.func, **kwargs, **args)
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+registry = ToolRegistry()
+tool = registry.register
+
+# 注册内置工具
+from .builtin import manage_memory  # noqa: E402,F401
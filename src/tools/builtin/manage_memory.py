@@ -0,0 +1,27 @@
+from typing import List
+from .. import tool
+
+
+# memories keep their values in a set, so only hashable (string) values can be stored
+@tool(
+    description="Save a memory to the memory manager. If the key already exists, the new value will be appended to the list unless override is set to True.",
+    params={
+        "key": "The key associated with the memory (always in English).",
+        "value": "The value(s) to store in memory, as a list of strings, even if it contains only one element.",
+        "override": "If True, overwrite the existing value. If False, append the new value to the list.",
+    },
+    context=("memory_manager",),
+    batched=True,
+)
+def save_memory(memory_manager, key: str, value: List[str], override: bool = False):
+    return memory_manager.save_memory(key, value, override)
+
+
+@tool(
+    description="Delete a memory from the memory manager.",
+    params={"key": "The key associated with the memory."},
+    context=("memory_manager",),
+    batched=True,
+)
+def delete_memory(memory_manager, key: str):
+    return memory_manager.delete_memory(key)
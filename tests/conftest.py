@@ -0,0 +1,6 @@
+import os
+import sys
+
+# a bare `pytest` does not put the repository root on sys.path the way `python -m pytest` does,
+# which the tests need to import `src` and the top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
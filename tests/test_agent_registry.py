@@ -0,0 +1,22 @@
+import os
+
+from agent import Agent, AgentRegistry
+
+
+def write_prompt(root, name: str, text: str):
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    with open(os.path.join(root, name, "prompt.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_plain_prompts_with_braces_load_as_raw_text(tmp_path):
+    write_prompt(tmp_path, "helper", 'Answer in JSON like {"reply": "..."}')
+    write_prompt(tmp_path, "clock", "Be brief.\nNow: {current_time}")
+    registry = AgentRegistry(str(tmp_path))
+
+    helper = Agent("helper", registry, client=object())
+    assert helper.get_prompt() == 'Answer in JSON like {"reply": "..."}'
+    assert helper.build([])[0]["content"] == helper.get_prompt()
+
+    clock = Agent("clock", registry, client=object())
+    assert clock.build([], current_time="noon", memory_summary="")[-1]["content"] == "Now: noon"
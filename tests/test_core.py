@@ -0,0 +1,308 @@
+import asyncio
+import time
+
+from src.core import EventManager, SpillFile
+from src.models import Event, EventStatus
+
+
+class Ping(Event):
+    __slots__ = ()
+
+
+class Pong(Event):
+    __slots__ = ()
+
+
+class Keyed(Event):
+    __slots__ = ("key",)
+
+    def __init__(self, key, **raw_data):
+        super().__init__(**raw_data)
+        self.key = key
+
+    @property
+    def partition_key(self):
+        return self.key
+
+
+def run_manager(coro, handlers, timeout: float = 5, **config):
+    saved = EventManager.handlers, EventManager.tasks, EventManager.lanes
+    EventManager.handlers, EventManager.tasks, EventManager.lanes = [], set(), {}
+    EventManager.dispatch_table.clear()
+
+    async def main():
+        EventManager.configure(**config)
+        for event_type, handler in handlers:
+            EventManager.register(event_type)(handler)
+        await EventManager.run()
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        finally:
+            await EventManager.shutdown(timeout=1)
+
+    try:
+        return asyncio.run(main())
+    finally:
+        EventManager.handlers, EventManager.tasks, EventManager.lanes = saved
+        EventManager.dispatch_table.clear()
+        EventManager.configure()
+
+
+def test_handlers_adding_events_do_not_deadlock_a_full_queue():
+    # every running handler adds an event while the queue is full and all slots are taken
+    count = 20
+    pongs = []
+    done = asyncio.Event()
+
+    async def on_ping(event: Ping):
+        await EventManager.add_event(Pong())
+
+    async def on_pong(event: Pong):
+        pongs.append(event)
+        if len(pongs) == count:
+            done.set()
+
+    async def flood():
+        for _ in range(count):
+            await EventManager.add_event(Ping())
+        await done.wait()
+        return len(pongs)
+
+    handlers = [(Ping, on_ping), (Pong, on_pong)]
+    assert run_manager(flood(), handlers, max_queue_size=2, max_in_flight=2) == count
+
+
+def test_delayed_event_runs_with_a_single_slot():
+    # neither dispatch loop may sit on the only slot while it waits for events
+    ran = asyncio.Event()
+
+    async def on_ping(event: Ping):
+        ran.set()
+
+    async def schedule():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await EventManager.add_event(Ping(), not_before=time.time() + 0.1)
+        await ran.wait()
+        return loop.time() - start
+
+    assert run_manager(schedule(), [(Ping, on_ping)], max_in_flight=1) < 1
+
+
+def test_lane_backlog_does_not_take_slots_from_other_keys():
+    finished = {}
+
+    async def on_keyed(event: Keyed):
+        await asyncio.sleep(0.05)
+        finished.setdefault(event.key, asyncio.get_running_loop().time())
+
+    async def busy_key():
+        start = asyncio.get_running_loop().time()
+        for _ in range(10):
+            await EventManager.add_event(Keyed(1))
+        await EventManager.add_event(Keyed(2))
+        while 2 not in finished:
+            await asyncio.sleep(0.01)
+        return finished[2] - start
+
+    # key 1 alone needs 0.5 s, key 2 must not wait behind it
+    assert run_manager(busy_key(), [(Keyed, on_keyed)], max_in_flight=4) < 0.25
+
+
+def test_full_lane_drops_oldest_waiting_event():
+    handled = []
+
+    async def on_keyed(event: Keyed):
+        await asyncio.sleep(0.02)
+        handled.append(event.id)
+
+    async def flood():
+        events = [Keyed(1) for _ in range(6)]
+        await EventManager.add_event(events[0])
+        await asyncio.sleep(0.01)
+        await EventManager.add_events(events[1:])
+        while EventManager.lanes or len(handled) < 3:
+            await asyncio.sleep(0.01)
+        return [event.id for event in events], handled
+
+    sent, handled = run_manager(flood(), [(Keyed, on_keyed)], overflow="drop_oldest", max_lane_backlog=2)
+    # the first is running when the rest arrive, only the two newest keep their place behind it
+    assert handled == [sent[0], sent[4], sent[5]]
+
+
+def test_full_lane_does_not_stall_other_keys():
+    finished = {}
+    order = []
+
+    async def on_keyed(event: Keyed):
+        await asyncio.sleep(0.05)
+        order.append(event.id)
+        finished[event.key] = asyncio.get_running_loop().time()
+
+    async def flood():
+        start = asyncio.get_running_loop().time()
+        events = [Keyed(1) for _ in range(10)]
+        await EventManager.add_events(events)
+        await EventManager.add_event(Keyed(2))
+        while len(order) < 11:
+            await asyncio.sleep(0.01)
+        return finished[2] - start, [event.id for event in events]
+
+    handlers = [(Keyed, on_keyed)]
+    elapsed, sent = run_manager(flood(), handlers, max_lane_backlog=3)
+    # key 1 overflows its backlog and keeps the rest in memory, in order, while key 2 runs right away
+    assert elapsed < 0.25
+    assert [event_id for event_id in order if event_id in sent] == sent
+
+
+def test_thread_handlers_add_events_on_the_dispatching_loop():
+    count = 10
+    pongs = []
+    done = asyncio.Event()
+
+    async def on_ping_async(event: Ping):
+        await EventManager.add_event(Pong())
+
+    def on_ping_sync(event: Ping):
+        asyncio.run(EventManager.add_event(Pong()))
+
+    async def on_pong(event: Pong):
+        pongs.append(event)
+        if len(pongs) == 2 * count:
+            done.set()
+
+    async def scenario():
+        EventManager.register(Ping, executor="thread")(on_ping_async)
+        EventManager.register(Ping, executor="thread")(on_ping_sync)
+        for _ in range(count):
+            await EventManager.add_event(Ping())
+        await done.wait()
+        return len(pongs)
+
+    assert run_manager(scenario(), [(Pong, on_pong)]) == 2 * count
+
+
+def test_spill_file_ignores_a_stale_file(tmp_path):
+    path = str(tmp_path / "queue.spill")
+    SpillFile(path).push("stale")
+    spill = SpillFile(path)
+    spill.push("new")
+    assert spill.pop() == "new"
+    assert len(spill) == 0
+
+
+def test_dispatch_table_follows_the_mro_and_priority():
+    class Special(Ping):
+        __slots__ = ()
+
+    async def first(event: Ping):
+        pass
+
+    async def second(event: Ping):
+        pass
+
+    async def special(event: Special):
+        pass
+
+    async def earliest(event: Event):
+        pass
+
+    saved = EventManager.handlers
+    EventManager.handlers = []
+    EventManager.dispatch_table.clear()
+    try:
+        EventManager.register(priority=1)(second)
+        EventManager.register(priority=1)(special)
+        EventManager.register(priority=0)(first)
+        assert [h.func for h in EventManager.get_handlers(Special)] == [first, second, special]
+        assert [h.func for h in EventManager.get_handlers(Ping)] == [first, second]
+        assert EventManager.get_handlers(Pong) == []
+        assert set(EventManager.dispatch_table) == {Special, Ping, Pong}
+        # registering a handler invalidates the cached lists, base-class handlers reach every subclass
+        EventManager.register(priority=-1)(earliest)
+        assert not EventManager.dispatch_table
+        assert [h.func for h in EventManager.get_handlers(Special)] == [earliest, first, second, special]
+        assert [h.func for h in EventManager.get_handlers(Pong)] == [earliest]
+    finally:
+        EventManager.handlers = saved
+        EventManager.dispatch_table.clear()
+
+
+def test_unpicklable_event_on_a_full_lane_does_not_stop_dispatch():
+    handled = []
+
+    async def on_keyed(event: Keyed):
+        await asyncio.sleep(0.02)
+        handled.append(event.key)
+
+    async def on_ping(event: Ping):
+        handled.append("ping")
+
+    async def flood():
+        dropped = EventManager.lane_dropped
+        await EventManager.add_event(Keyed(1))
+        await asyncio.sleep(0.005)
+        await EventManager.add_event(Keyed(1))
+        unpicklable = Keyed(1)
+        unpicklable.summary = lambda: None
+        await EventManager.add_event(unpicklable)
+        await EventManager.add_event(Ping())
+        while "ping" not in handled or EventManager.lanes:
+            await asyncio.sleep(0.01)
+        return EventManager.lane_dropped - dropped
+
+    assert run_manager(flood(), [(Keyed, on_keyed), (Ping, on_ping)], overflow="spill", max_lane_backlog=1) == 1
+    assert handled.count(1) == 2
+
+
+def flood_keys(overflow: str):
+    handled = []
+    peak = []
+
+    async def on_keyed(event: Keyed):
+        peak.append(EventManager.lane_events)
+        await asyncio.sleep(0.01)
+        handled.append(event.key)
+
+    async def flood():
+        spilled = EventManager.lane_spilled
+        for i in range(30):
+            await EventManager.add_event(Keyed(i % 10))
+        while len(handled) < 30:
+            await asyncio.sleep(0.01)
+        return EventManager.lane_spilled - spilled
+
+    config = dict(overflow=overflow, max_queue_size=5, max_in_flight=2, max_lane_events=4)
+    spilled = run_manager(flood(), [(Keyed, on_keyed)], **config)
+    return handled, max(peak), spilled
+
+
+def test_lanes_share_a_memory_budget_that_pushes_back_under_block():
+    handled, peak, spilled = flood_keys("block")
+    assert sorted(handled) == sorted(i % 10 for i in range(30))
+    assert peak <= 4 and spilled == 0
+
+
+def test_lanes_spill_past_the_memory_budget():
+    handled, peak, spilled = flood_keys("spill")
+    assert sorted(handled) == sorted(i % 10 for i in range(30))
+    assert peak <= 4 and spilled > 0
+
+
+
+def deprecate_in_process(event: Ping):
+    # a process handler works on a pickled copy, only the status is carried back
+    event.status = EventStatus.DEPRECATED
+
+
+def test_process_handlers_run_in_a_pool_and_return_the_status():
+    async def scenario():
+        EventManager.register(Ping, executor="process")(deprecate_in_process)
+        event = Ping()
+        await EventManager.handle_event(event)
+        pool = EventManager.pools["process"]
+        return event.status, pool._mp_context.get_start_method()
+
+    status, method = run_manager(scenario(), [], timeout=30)
+    assert status == EventStatus.DEPRECATED
+    assert method in ("forkserver", "spawn")
@@ -0,0 +1,36 @@
+import asyncio
+import os
+
+import httpx
+
+from src.download import Downloader, MediaCache, media_downloads
+from src.models import DownloadEvent, EventStatus, Message, MessageSegment, MessageType
+
+
+def test_downloads_stay_in_the_cache_and_eviction_frees_them(tmp_path):
+    cache = MediaCache(os.path.join(tmp_path, "cache"), max_bytes=2500)
+    downloader = Downloader(cache)
+    downloader.http_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=request.url.path.encode() * 100)))
+
+    async def main():
+        events = [DownloadEvent(f"http://media.test/{i:04d}") for i in range(5)]
+        for event in events:
+            await downloader.handle(event)
+        await downloader.close()
+        return events
+
+    events = asyncio.run(main())
+    assert all(event.status == EventStatus.COMPLETE for event in events)
+    assert all(os.path.dirname(os.path.dirname(event.path)) == cache.directory for event in events)
+    on_disk = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(tmp_path) for name in names)
+    assert on_disk == cache.total_bytes <= cache.max_bytes
+
+
+def test_only_image_file_names_identify_content():
+    segments = [
+        {"type": "image", "data": {"file": "0a1b2c.image", "url": "http://media.test/a"}},
+        {"type": "file", "data": {"file": "report.pdf", "url": "http://media.test/b"}},
+    ]
+    message = Message(1, 2, MessageType.PRIVATE, 0, "", [MessageSegment.from_dict(segment) for segment in segments])
+    events = media_downloads(message)
+    assert [event.key for event in events] == ["0a1b2c.image", None]
@@ -0,0 +1,51 @@
+import asyncio
+
+from src.agent import MemoryManager, chat
+from src.history import ConversationHistory, message_tokens
+from src.prompt import PromptBuilder
+
+
+def tool_turn(i):
+    return [
+        {"role": "user", "content": f"question {i} " * 10},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": f"call-{i}", "type": "function", "function": {"name": "lookup", "arguments": f'{{"n": {i}}}'}}]},
+        {"role": "tool", "tool_call_id": f"call-{i}", "content": f"result {i} " * 10},
+        {"role": "assistant", "content": f"answer {i} " * 10},
+    ]
+
+
+def test_trim_evicts_whole_turns_and_keeps_tool_replies_with_their_calls():
+    turn_tokens = sum(message_tokens(message) for message in tool_turn(0))
+    history = ConversationHistory(token_budget=turn_tokens * 2 + 5, summarize=False)
+    for i in range(5):
+        for message in tool_turn(i):
+            history.append(message)
+        assert history.total_tokens <= history.token_budget
+        assert history.messages[0]["role"] == "user"
+        call_ids = {call["id"] for message in history.messages for call in message.get("tool_calls") or ()}
+        reply_ids = {message["tool_call_id"] for message in history.messages if message["role"] == "tool"}
+        assert call_ids == reply_ids
+    assert history.messages == tool_turn(3) + tool_turn(4)
+    assert history.total_tokens == sum(message_tokens(message) for message in history.messages)
+
+
+def test_trim_never_evicts_the_newest_turn():
+    history = ConversationHistory(token_budget=20, summarize=False)
+    history.append({"role": "user", "content": "short"})
+    history.append({"role": "assistant", "content": "ok"})
+    long_turn = [{"role": "user", "content": "a long question " * 50}, {"role": "assistant", "content": "a long answer " * 50}]
+    for message in long_turn:
+        history.append(message)
+    assert history.messages == long_turn
+    assert history.total_tokens > history.token_budget
+
+
+def test_chat_keeps_an_empty_history_passed_in(tmp_path, monkeypatch):
+    class RecordingHistory(ConversationHistory):
+        async def wait(self):
+            self.waited = True
+
+    history = RecordingHistory()
+    monkeypatch.setattr("builtins.input", lambda prompt="": "exit")
+    asyncio.run(chat(MemoryManager(str(tmp_path / "memories.json")), PromptBuilder("system"), history))
+    assert len(history) == 0 and history.waited
@@ -0,0 +1,115 @@
+import asyncio
+import os
+
+from src import models
+from src.core import EventManager
+from src.journal import EventJournal, open_journal, read_records
+from src.models import Event
+
+
+class Ping(Event):
+    __slots__ = ()
+
+
+def run_to_completion(journal: EventJournal, event: Event):
+    journal.added(event)
+    journal.finish(event, journal.begin(event))
+
+
+def test_integer_ids_of_a_new_run_do_not_close_recovered_events(tmp_path):
+    path = os.path.join(tmp_path, "events.journal")
+    models.use_integer_ids()
+    try:
+        journal = EventJournal(path)
+        journal.recover()
+        journal.open()
+        journal.added(Ping()) # never finished
+        journal.close()
+
+        models.use_integer_ids() # a restart, ids count from 1 again
+        fresh = Ping()
+        journal = EventJournal(path)
+        recovered = journal.recover()
+        journal.open()
+        assert len(recovered) == 1 and recovered[0].id != fresh.id
+        run_to_completion(journal, fresh)
+        journal.close()
+
+        # still open, recovery hands it a new id again
+        assert len(EventJournal(path).recover()) == 1
+    finally:
+        models.use_integer_ids(False)
+
+
+def test_journal_is_compacted_while_running(tmp_path):
+    path = os.path.join(tmp_path, "events.journal")
+    journal = EventJournal(path, compact_every=10)
+    journal.open()
+    unfinished = Ping()
+    journal.added(unfinished)
+    for _ in range(50):
+        run_to_completion(journal, Ping())
+    journal.close()
+
+    assert sum(1 for _ in read_records(path)) < 10
+    assert os.path.exists(path + ".1")
+    assert [event.id for event in EventJournal(path).recover()] == [unfinished.id]
+
+
+def test_recovery_queues_more_events_than_the_queue_holds(tmp_path):
+    path = os.path.join(tmp_path, "events.journal")
+    journal = EventJournal(path)
+    journal.open()
+    for _ in range(15):
+        journal.added(Ping())
+    journal.close()
+
+    handled = []
+
+    async def on_ping(event: Ping):
+        handled.append(event)
+
+    async def main():
+        EventManager.configure(max_queue_size=10)
+        EventManager.register(Ping)(on_ping)
+        try:
+            # before run(), like main.py
+            await asyncio.wait_for(open_journal(path), 2)
+            await EventManager.run()
+            while len(handled) < 15:
+                await asyncio.sleep(0.01)
+        finally:
+            await EventManager.shutdown(timeout=1)
+
+    saved = EventManager.handlers
+    EventManager.handlers = []
+    EventManager.dispatch_table.clear()
+    try:
+        asyncio.run(asyncio.wait_for(main(), 5))
+    finally:
+        EventManager.handlers = saved
+        EventManager.dispatch_table.clear()
+        EventManager.configure()
+    assert len(handled) == 15
+
+
+def test_events_dropped_by_the_overflow_policy_are_not_recovered(tmp_path):
+    path = os.path.join(tmp_path, "events.journal")
+    journal = EventJournal(path)
+    journal.open()
+
+    async def main():
+        EventManager.configure(max_queue_size=2, overflow="drop_oldest")
+        EventManager.journal = journal
+        events = [Ping() for _ in range(50)]
+        for event in events:
+            await EventManager.add_event(event)
+        await EventManager.shutdown()
+        return events
+
+    try:
+        events = asyncio.run(main())
+    finally:
+        EventManager.configure()
+    assert len(journal.open_records) == 2
+    assert [event.id for event in EventJournal(path).recover()] == [event.id for event in events[-2:]]
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
+from openai.types.chat.chat_completion_chunk import ChoiceDelta, ChoiceDeltaToolCall, ChoiceDeltaToolCallFunction
+
+from benchmarks.llm_stub import StubLLMServer
+from src.llm import LLMClient, MessageStream, TokenBucket
+
+
+def chunk(content=None, tool_calls=None, finish_reason=None):
+    return ChatCompletionChunk(
+        id="chatcmpl-1",
+        object="chat.completion.chunk",
+        created=0,
+        model="stub",
+        choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=content, tool_calls=tool_calls), finish_reason=finish_reason)],
+    )
+
+
+def tool_delta(index, id=None, name=None, arguments=None):
+    return [ChoiceDeltaToolCall(index=index, id=id, function=ChoiceDeltaToolCallFunction(name=name, arguments=arguments))]
+
+
+async def from_list(chunks):
+    for item in chunks:
+        yield item
+
+
+def test_tool_call_deltas_are_assembled_across_chunks():
+    chunks = [
+        chunk(tool_calls=tool_delta(0, id="call_1", name="save_", arguments='{"key": ')),
+        chunk(tool_calls=tool_delta(1, id="call_2", name="delete_memory", arguments='{"key": "b"}')),
+        chunk(tool_calls=tool_delta(0, name="memory", arguments='"a", "value": ["x"]}')),
+        chunk(finish_reason="tool_calls"),
+    ]
+    closed = []
+    stream = MessageStream(from_list(chunks), on_close=lambda: closed.append(True))
+    message = asyncio.run(stream.collect())
+    assert message.content is None
+    assert [(call.id, call.function.name, call.function.arguments) for call in message.tool_calls] == [
+        ("call_1", "save_memory", '{"key": "a", "value": ["x"]}'),
+        ("call_2", "delete_memory", '{"key": "b"}'),
+    ]
+    assert stream.finish_reason == "tool_calls" and closed == [True]
+
+
+def test_sentences_split_on_sentence_ends_only():
+    deltas = ["Pi is 3.", "14. Hello wor", "ld! 你好。再", "见"]
+    stream = MessageStream(from_list([chunk(content=delta) for delta in deltas] + [chunk(finish_reason="stop")]))
+
+    async def main():
+        return [sentence async for sentence in stream.sentences()]
+
+    assert asyncio.run(main()) == ["Pi is 3.14.", " Hello world! 你好。", "再见"]
+    assert stream.message.content == "".join(deltas)
+
+
+def test_requests_retry_transient_errors_with_backoff():
+    client = LLMClient(api_key="test", max_retries=2, backoff_base=0.001)
+    attempts = []
+
+    async def flaky(fail: int, error=None):
+        attempts.append(fail)
+        if len(attempts) <= fail:
+            raise error or openai.APIConnectionError(request=httpx.Request("POST", "http://llm.test"))
+        return "ok"
+
+    async def main():
+        results = [await client.request(flaky, fail=2)]
+        for fail, error in ((3, None), (1, ValueError("bad request"))):
+            attempts.clear()
+            try:
+                await client.request(flaky, fail=fail, error=error)
+            except Exception as e:
+                results.append((type(e), len(attempts)))
+        await client.close()
+        return results
+
+    assert asyncio.run(main()) == ["ok", (openai.APIConnectionError, 3), (ValueError, 1)]
+
+
+def test_an_abandoned_stream_gives_back_its_concurrency_slot():
+    async def main():
+        llm = StubLLMServer(0, 0.001, 50, 0, 0)
+        await llm.start()
+        client = LLMClient(api_key="test", base_url=llm.base_url, max_concurrency=1)
+        messages = [{"role": "user", "content": "hi"}]
+        stream = await client.stream(messages)
+        async for _ in stream:
+            break
+        await stream.close()
+        # with a single slot this only returns if the first stream released it
+        second = await asyncio.wait_for(client.stream(messages), 2)
+        message = await second.collect()
+        free = client.semaphore._value
+        await client.close()
+        await llm.stop()
+        return message, free
+
+    message, free = asyncio.run(main())
+    assert message.content.startswith("word0")
+    assert free == 1
+
+
+def test_token_bucket_limits_the_rate_after_a_burst():
+    bucket = TokenBucket(rate=50, capacity=2)
+
+    async def main():
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # two requests go out at once, the other three wait for a refill each
+    assert 0.05 <= asyncio.run(main()) < 0.5
@@ -0,0 +1,64 @@
+import asyncio
+
+from benchmarks.llm_stub import StubLLMServer
+from src.llm import LLMClient
+from src.llm_cache import MemoryCache, ResponseCache, deterministic_only, final_answers
+from src.prompt import PromptBuilder
+
+TOOLS = [{"type": "function", "function": {"name": "noop", "parameters": {"type": "object", "properties": {}}}}]
+
+
+def test_streamed_turns_are_served_from_the_cache():
+    builder = PromptBuilder("You are a bot.\nNow: {current_time}\n{memory_summary}")
+    history = [{"role": "user", "content": "what can you do?"}]
+
+    async def main():
+        llm = StubLLMServer(0, 0, 8, 0, 0)
+        await llm.start()
+        client = LLMClient(api_key="test", base_url=llm.base_url, cache=ResponseCache(MemoryCache()))
+        replies = []
+        for now in ("2026-01-01T10:00:00", "2026-01-01T10:00:05", "2026-01-01T11:00:00"):
+            context = {"current_time": now, "memory_summary": ""}
+            stream = await client.stream(
+                builder.build(history, **context), cache_messages=builder.cache_messages(history, **context), temperature=0
+            )
+            sentences = [sentence async for sentence in stream.sentences()]
+            replies.append(("".join(sentences), stream.message.content))
+        stats = client.cache.stats()
+        await client.close()
+        await llm.stop()
+        return replies, llm.requests, stats
+
+    replies, requests, stats = asyncio.run(main())
+    assert replies[0] == replies[1] and replies[0][0] == replies[0][1]
+    # seconds apart share a key, the next hour does not
+    assert requests == 2
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_default_policy_covers_chat_turns_but_not_sampling():
+    turn = {"model": "m", "messages": [], "tools": TOOLS}
+    assert final_answers({**turn, "temperature": 0})
+    # without a temperature the provider samples at its default, the answer is not repeatable
+    assert not final_answers(turn)
+    assert not final_answers({**turn, "temperature": 0.7})
+    assert not deterministic_only(turn)
+    assert deterministic_only({"model": "m", "messages": [], "temperature": 0})
+
+
+def test_chat_turns_use_the_cache_only_with_an_explicit_temperature():
+    history = [{"role": "user", "content": "hello"}]
+
+    async def requests_for(temperature):
+        llm = StubLLMServer(0, 0, 4, 0, 0)
+        await llm.start()
+        client = LLMClient(api_key="test", base_url=llm.base_url, cache=ResponseCache(MemoryCache()), temperature=temperature)
+        for _ in range(2):
+            await (await client.stream(history, tools=TOOLS)).collect()
+        await client.close()
+        await llm.stop()
+        return llm.requests, client.cache.stats()
+
+    (skipped, skipped_stats), (cached, cached_stats) = asyncio.run(requests_for(None)), asyncio.run(requests_for(0))
+    assert skipped == 2 and skipped_stats["hits"] == 0
+    assert cached == 1 and cached_stats["hits"] == 1
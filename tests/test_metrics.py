@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from src import metrics
+from src.agent import MemoryManager, run_turn
+from src.history import ConversationHistory
+from src.llm import LLMClient, get_client, set_client
+from src.metrics import Histogram, Registry, Turn
+from src.prompt import PromptBuilder
+
+
+def test_histogram_buckets_are_inclusive_and_quantiles_use_upper_bounds():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert (histogram.count, histogram.sum) == (5, 16.0)
+    assert histogram.quantile(0.4) == 1
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(1.0) == float("inf")
+    assert Histogram((1,)).quantile(0.5) == 0.0
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    registry.inc("turns_total")
+    registry.inc("tokens_total", 5, kind="prompt")
+    registry.histogram("turn_seconds", (0.1, 1)).observe(0.5)
+    assert registry.render_prometheus() == "\n".join([
+        "# TYPE tokens_total counter",
+        'tokens_total{kind="prompt"} 5',
+        "# TYPE turns_total counter",
+        "turns_total 1",
+        "# TYPE turn_seconds histogram",
+        'turn_seconds_bucket{le="0.1"} 0',
+        'turn_seconds_bucket{le="1"} 1',
+        'turn_seconds_bucket{le="+Inf"} 1',
+        "turn_seconds_sum 0.5",
+        "turn_seconds_count 1",
+    ]) + "\n"
+
+
+class Collect:
+    def __init__(self):
+        self.records = []
+
+    def export(self, record: dict):
+        self.records.append(record)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    exporter = Collect()
+    monkeypatch.setattr(metrics, "exporters", [exporter])
+    monkeypatch.setattr(metrics, "registry", Registry())
+    return exporter.records
+
+
+def test_turn_exports_usage_and_spans(exported):
+    turn = Turn(user=1)
+    with turn.span("llm"):
+        turn.add_usage(SimpleNamespace(prompt_tokens=100, completion_tokens=20, prompt_cache_hit_tokens=64))
+    turn.add_usage(SimpleNamespace(prompt_tokens=120, completion_tokens=5, prompt_tokens_details=SimpleNamespace(cached_tokens=100)))
+    turn.add_usage(None)
+    record = turn.finish()
+    assert exported == [record]
+    assert (record["llm_calls"], record["prompt_tokens"], record["completion_tokens"], record["cached_tokens"]) == (3, 220, 25, 164)
+    assert [span["name"] for span in record["spans"]] == ["llm"] and record["user"] == 1
+    assert metrics.registry.counters[("agent_tokens_total", (("kind", "cached"),))] == 164
+
+
+def test_failed_turn_is_still_recorded(exported):
+    with pytest.raises(TimeoutError):
+        with Turn() as turn:
+            with turn.span("llm"):
+                raise TimeoutError
+    [record] = exported
+    assert record["error"] == "TimeoutError" and record["spans"][0]["error"] == "TimeoutError"
+    assert metrics.registry.counters[("agent_turn_errors_total", (("error", "TimeoutError"),))] == 1
+
+
+def test_run_turn_records_a_failing_llm_call(exported, tmp_path):
+    async def main():
+        set_client(LLMClient(api_key="test", base_url="http://127.0.0.1:9", max_retries=0))
+        memory_manager = MemoryManager(str(tmp_path / "memories.json"))
+        try:
+            await run_turn("hi", memory_manager, PromptBuilder("You are a bot."), ConversationHistory(summarize=False), user=1)
+        finally:
+            await get_client().close()
+            set_client(None)
+            memory_manager.close()
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(main())
+    [record] = exported
+    assert record["error"] == "APIConnectionError" and record["user"] == 1
+    assert [span["name"] for span in record["spans"]] == ["llm"]
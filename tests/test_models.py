@@ -0,0 +1,46 @@
+from src.models import (
+    SEGMENT_CLASSES,
+    AtSegment,
+    DownloadEvent,
+    ImageSegment,
+    Message,
+    MessageSegment,
+    MessageSegmentType,
+    TextSegment,
+    UnknownSegment,
+)
+
+
+def test_segments_are_built_from_the_registry():
+    assert set(SEGMENT_CLASSES) == {segment_type.value for segment_type in MessageSegmentType}
+    image = MessageSegment.from_dict({"type": "image", "data": {"file": "a.jpg", "url": "http://media.test/a.jpg"}})
+    assert isinstance(image, ImageSegment) and image.type == MessageSegmentType.IMAGE
+    assert (image.file, image.url) == ("a.jpg", "http://media.test/a.jpg")
+    at = MessageSegment.from_dict({"type": "at", "data": {"qq": "all"}})
+    assert isinstance(at, AtSegment) and str(at) == "@all"
+
+
+def test_malformed_segments_fall_back_to_unknown():
+    for raw in ({"type": "poke", "data": {}}, {"type": ["text"]}, {"type": {"text": 1}}, {"data": None}, None, "text", 3):
+        segment = MessageSegment.from_dict(raw)
+        assert isinstance(segment, UnknownSegment) and segment.type == MessageSegmentType.UNKNOWN
+        assert segment.data == {}
+
+
+def test_message_segments_survive_malformed_payloads():
+    frame = {"message_type": "group", "group_id": 7, "user_id": 1, "raw_message": "hi"}
+    assert Message.from_dict({**frame, "message": None}).segments == []
+    assert Message.from_dict({**frame, "message": {"type": "text"}}).segments == []
+    segments = Message.from_dict({**frame, "message": [{"type": "text", "data": {"text": "hi"}}, {"type": None}]}).segments
+    assert isinstance(segments[0], TextSegment) and segments[0].content == "hi"
+    assert isinstance(segments[1], UnknownSegment)
+    assert [str(segment) for segment in Message.from_dict({**frame, "message": "hi [CQ:face,id=1]"}).segments] == ["hi [CQ:face,id=1]"]
+
+
+def test_raw_data_is_a_dict_created_on_first_use():
+    event = DownloadEvent("http://media.test/a")
+    assert event._raw_data is None
+    assert event.raw_data.get("origin") is None
+    event.raw_data["origin"] = "qq"
+    assert event.raw_data == {"origin": "qq"}
+    assert DownloadEvent("http://media.test/a", origin="qq").raw_data == {"origin": "qq"}
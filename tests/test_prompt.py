@@ -0,0 +1,37 @@
+import json
+
+from src.agent import MemoryManager
+from src.prompt import PromptBuilder
+
+TEMPLATE = """You are a bot, answer in {{"reply": ...}} form.
+Now: {current_time}
+Memories: {memory_summary}
+Be brief."""
+
+
+def test_system_message_is_byte_stable_while_the_context_changes():
+    builder = PromptBuilder(TEMPLATE)
+    history = [{"role": "user", "content": "hi"}]
+    first = builder.build(history, current_time="2026-01-01T10:00:00", memory_summary="{}")
+    second = builder.build([*history, {"role": "assistant", "content": "hello"}], current_time="2026-01-01T10:00:05", memory_summary='{"a":1}')
+    assert json.dumps(first[0]) == json.dumps(second[0])
+    assert first[0]["content"] == 'You are a bot, answer in {"reply": ...} form.\nBe brief.'
+    assert first[1:-1] == second[1:2]
+    assert first[-1]["content"] == "Now: 2026-01-01T10:00:00\nMemories: {}"
+    assert second[-1]["content"] == 'Now: 2026-01-01T10:00:05\nMemories: {"a":1}'
+    # the cache key only sees the hour
+    assert builder.cache_messages(history, current_time="2026-01-01T10:00:05", memory_summary="{}") == builder.build(
+        history, current_time="2026-01-01T10", memory_summary="{}"
+    )
+
+
+def test_render_block_is_memoized_until_the_memories_change(tmp_path):
+    manager = MemoryManager(str(tmp_path / "memories.json"))
+    manager.save_memory("user.movies", ["Inception"])
+    first = manager.render_block("which movies do I like")
+    assert manager.render_block("which movies do I like") is first
+    manager.save_memory("user.movies", ["Tenet"])
+    changed = manager.render_block("which movies do I like")
+    assert changed is not first and "Tenet" in changed
+    assert all(key[0] == manager.version for key in manager.rendered)
+    manager.close()
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+import websockets
+
+from src import qqws
+from src.core import EventManager
+from src.models import MessageEvent
+
+
+def message_frame(i: int) -> str:
+    return json.dumps({"post_type": "message", "message_type": "private", "message_id": i, "user_id": 1, "raw_message": f"m{i}", "message": f"m{i}"})
+
+
+class FakeWebSocket:
+    """Hands out the given frames, then behaves like a closed connection"""
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    async def recv(self):
+        await asyncio.sleep(0)
+        if not self.frames:
+            raise websockets.ConnectionClosed(None, None)
+        return self.frames.pop(0)
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    added = []
+
+    async def add_events(events, block=None):
+        added.append(list(events))
+
+    monkeypatch.setattr(EventManager, "add_events", add_events)
+    monkeypatch.setattr(qqws, "stats", dict.fromkeys(qqws.stats, 0))
+    return added
+
+
+def test_post_type_reads_str_and_bytes_frames_without_decoding():
+    assert qqws.post_type('{"time": 1, "post_type" : "meta_event"}') == "meta_event"
+    assert qqws.post_type(b'{"post_type":"message","message":[]}') == "message"
+    assert qqws.post_type('{"status": "ok", "retcode": 0}') is None
+
+
+def test_decode_frames_batches_what_is_buffered_and_counts_errors(batches):
+    async def main():
+        frames = asyncio.Queue()
+        for frame in [message_frame(1), message_frame(2), '{"post_type": "message", ', message_frame(3).encode(), None]:
+            frames.put_nowait(frame)
+        await qqws.decode_frames(frames, batch_size=2)
+
+    asyncio.run(main())
+    # the closing None arrives in a batch of its own here
+    assert [[event.message.message_id for event in batch] for batch in batches] == [[1, 2], [3], []]
+    assert all(isinstance(event, MessageEvent) for batch in batches for event in batch)
+    assert qqws.stats["errors"] == 1 and qqws.stats["decoded"] == 3 and qqws.stats["batches"] == 3
+
+
+def test_ingest_filters_other_post_types_and_drains_on_close(batches):
+    frames = [
+        '{"post_type": "meta_event", "meta_event_type": "heartbeat"}',
+        message_frame(1),
+        '{"post_type": "notice", "notice_type": "group_increase"}',
+        message_frame(2).encode(),
+        '{"status": "ok", "retcode": 0, "echo": 1}',
+        message_frame(3),
+    ]
+
+    async def main():
+        with pytest.raises(websockets.ConnectionClosed):
+            await qqws.ingest(FakeWebSocket(frames), buffer_size=2, batch_size=64)
+
+    asyncio.run(main())
+    # every message frame received before the close reaches EventManager
+    assert [event.message.message_id for batch in batches for event in batch] == [1, 2, 3]
+    assert qqws.stats["received"] == 6 and qqws.stats["filtered"] == 3
@@ -0,0 +1,53 @@
+from src.retrieval import MemoryIndex, render_tree
+from src.storage import Memory
+
+
+def test_removed_rows_are_reused_and_never_returned():
+    index = MemoryIndex()
+    for i in range(100):
+        index.add(Memory(f"note.{i}", {f"movie number {i}"}))
+    rows = len(index.keys)
+    for i in range(0, 100, 2):
+        index.remove(f"note.{i}")
+    assert len(index) == 50
+    results = index.search("movie number", top_k=100)
+    assert sorted(key for key, _ in results) == sorted(f"note.{i}" for i in range(1, 100, 2))
+    for i in range(50):
+        index.add(Memory(f"song.{i}", {f"song title {i}"}))
+    # new entries fill the freed rows instead of growing the arrays
+    assert len(index.keys) == rows and not index.free
+    assert len(index.search("movie song", top_k=1000)) == 100
+
+
+def test_grow_keeps_existing_rows():
+    index = MemoryIndex(dim=32)
+    for i in range(200):
+        index.add(Memory(f"k{i}", {f"value{i}"}))
+    assert len(index.alive) >= 200 and index.alive[:200].all()
+    assert index.search("value7", top_k=1)[0][0] == "k7"
+    assert index.total_length == sum(index.lengths[:200])
+
+
+def test_bm25_is_normalized_to_the_best_match():
+    index = MemoryIndex(embedding_weight=0)
+    index.add(Memory("user.movies", {"likes the movie Inception"}))
+    index.add(Memory("user.food", {"likes noodles"}))
+    index.add(Memory("user.city", {"lives in Hangzhou"}))
+    results = index.search("inception movie", top_k=3)
+    assert results[0] == ("user.movies", 1.0)
+    assert all(score <= 1.0 for _, score in results)
+    assert dict(results)["user.city"] == 0
+
+
+def test_updating_a_key_replaces_its_terms():
+    index = MemoryIndex(embedding_weight=0)
+    index.add(Memory("user.pet", {"has a cat"}))
+    index.add(Memory("user.pet", {"has a dog"}))
+    assert len(index) == 1
+    assert "cat" not in index.postings
+    assert index.search("dog", top_k=1) == [("user.pet", 1.0)]
+
+
+def test_render_tree_keeps_a_child_named_value():
+    memories = [Memory("a", {"own"}), Memory("a._value", {"child"}), Memory("a.b", {"b"})]
+    assert render_tree(memories) == {"a": {"_value": ["child"], "b": ["b"], "__value": ["own"]}}
@@ -0,0 +1,21 @@
+import asyncio
+import os
+
+from src.runtime import AgentRuntime
+from src.storage import open_storage
+
+
+def test_new_session_is_not_evicted_while_others_are_busy(tmp_path):
+    runtime = AgentRuntime(open_storage(os.path.join(tmp_path, "memories.db")), sessions_dir=os.path.join(tmp_path, "sessions"), max_sessions=1)
+
+    async def main():
+        busy = runtime.get_session("private.1")
+        async with busy.lock:
+            session = runtime.get_session("private.2")
+            # over the limit for now, but the session about to run a turn must stay cached
+            assert runtime.sessions.get("private.2") is session
+        runtime.evict()
+        assert list(runtime.sessions) == ["private.2"]
+        await runtime.close()
+
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import pytest
+
+from src.storage import JsonStorage, KeyTrie, Memory, NamespacedStorage, SQLiteStorage
+
+
+async def write_in_batch(storage, key: str, delay: float, fail: bool = False):
+    with storage.batch():
+        await asyncio.sleep(delay)
+        storage.put(Memory(key, {"value"}))
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("tool failed")
+
+
+def overlap(storage, fail_first: bool = False):
+    # two sessions over one storage, their batches enter and exit in interleaved order
+    async def main():
+        await asyncio.gather(
+            write_in_batch(NamespacedStorage(storage, "user1"), "a", 0.01, fail_first),
+            write_in_batch(NamespacedStorage(storage, "user2"), "b", 0.02),
+            return_exceptions=True,
+        )
+
+    asyncio.run(main())
+
+
+def test_json_overlapping_batches_restore_write_through(tmp_path):
+    storage = JsonStorage(os.path.join(tmp_path, "memories.json"))
+    overlap(storage)
+    assert not storage.pending
+    storage.put(Memory("later", {"value"}))
+    assert not storage.pending
+
+
+@pytest.mark.parametrize("fail_first", [False, True])
+def test_sqlite_overlapping_batches_keep_each_others_writes(tmp_path, fail_first):
+    path = os.path.join(tmp_path, "memories.db")
+    storage = SQLiteStorage(path)
+    overlap(storage, fail_first)
+    assert storage.batch_depth == 0
+    storage.close()
+    reopened = SQLiteStorage(path)
+    assert reopened.get("user2.b") is not None
+    reopened.close()
+
+
+@pytest.mark.parametrize("backend", [JsonStorage, SQLiteStorage])
+def test_prefix_counts_match_the_listing_without_loading_memories(tmp_path, monkeypatch, backend):
+    storage = backend(os.path.join(tmp_path, "memories"))
+    for key in ("user1", "user1.a", "user1.b.c", "user1.b.d", "user10.a", "user2.a"):
+        storage.put(Memory(key, {"value"}))
+    storage.delete("user1.b.d")
+    for prefix in ("user1", "user1.b", "user10", "user", "missing"):
+        assert storage.count_prefix(prefix) == len(list(storage.with_prefix(prefix)))
+    view = NamespacedStorage(storage, "user1")
+    expected = len(list(view.values()))
+    monkeypatch.setattr(storage, "with_prefix", None)
+    assert len(view) == expected == 2
+    assert view.count_prefix("b") == 1
+    storage.close()
+
+
+def test_json_compaction_is_amortized_over_the_snapshot_size(tmp_path, monkeypatch):
+    path = os.path.join(tmp_path, "memories.json")
+    storage = JsonStorage(path, compact_every=10)
+    compactions = []
+    compact = storage.compact
+    monkeypatch.setattr(storage, "compact", lambda: compactions.append(len(storage)) or compact())
+    for i in range(2000):
+        storage.put(Memory(f"note.{i}", {f"value {i}"}))
+    storage.close()
+    # the journal has to grow with the snapshot before it is rewritten, so the gaps widen geometrically
+    assert len(compactions) < 20
+    assert all(later >= earlier * 1.3 for earlier, later in zip(compactions[1:], compactions[2:]))
+    with open(path, encoding="utf-8") as f:
+        assert "\n" not in f.read()
+    assert len(JsonStorage(path)) == 2000
+
+
+def test_trie_counts_and_prunes_removed_subtrees():
+    trie = KeyTrie(["user", "user.a", "user.b.c", "user.b.d", "user10.a"])
+    assert (len(trie), trie.count("user"), trie.count("user.b"), trie.count("")) == (5, 4, 2, 5)
+    assert sorted(trie.remove_prefix("user.b")) == ["user.b.c", "user.b.d"]
+    assert "b" not in trie.find("user").children
+    assert (len(trie), trie.count("user"), trie.count("user.b")) == (3, 2, 0)
+    assert not trie.remove("user.b.c") and not trie.remove("user.missing")
+    # removing a key that still has children keeps the node, a later leaf removal prunes the chain
+    assert trie.remove("user")
+    assert trie.count("user") == 1 and trie.keys("user") == ["user.a"]
+    assert trie.remove("user.a")
+    assert "user" not in trie.root.children
+    assert trie.keys() == ["user10.a"] and trie.root.count == 1
@@ -0,0 +1,70 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from src.tools import ToolRegistry, registry
+
+
+def make_registry():
+    tools = ToolRegistry()
+
+    @tools.register(context=("store",), batched=True)
+    def remember(store, key: str, tags: List[str], count: int = 1, note: Optional[str] = None):
+        store[key] = (tags, count, note)
+        return {"status": "ok"}
+
+    @tools.register()
+    async def fail(reason: str):
+        raise RuntimeError(reason)
+
+    return tools
+
+
+def test_schema_leaves_out_context_arguments():
+    tools = make_registry()
+    parameters = tools.get("remember").schema["function"]["parameters"]
+    assert list(parameters["properties"]) == ["key", "tags", "count", "note"]
+    assert parameters["required"] == ["key", "tags"]
+    assert parameters["properties"]["tags"] == {"type": "array", "items": {"type": "string"}}
+    assert parameters["properties"]["note"] == {"type": "string", "default": None}
+    assert tools.schemas() is tools.schemas()
+
+
+def test_validation_rejects_bad_arguments():
+    tool = make_registry().get("remember")
+    assert tool.validate({"key": "a", "tags": ["x"], "count": 2}) is None
+    assert "count" in tool.validate({"key": "a", "tags": ["x"], "count": True})
+    assert "tags" in tool.validate({"key": "a", "tags": ["x", 1]})
+    assert "tags" in tool.validate({"key": "a", "tags": "x"})
+    assert tool.validate({"key": "a"}) == "missing required argument(s): tags"
+    assert tool.validate({"key": "a", "tags": [], "store": {}}) == "unexpected argument: store"
+    assert tool.validate(["a"]) == "arguments must be a JSON object"
+
+
+def test_call_injects_context_and_reports_errors():
+    tools = make_registry()
+    store = {}
+
+    async def main():
+        ok = await tools.call("remember", json.dumps({"key": "a", "tags": ["x"]}), store=store)
+        invalid = await tools.call("remember", "{not json", store=store)
+        wrong = await tools.call("remember", json.dumps({"key": "a", "tags": [1]}), store=store)
+        failed = await tools.call("fail", json.dumps({"reason": "boom"}))
+        unknown = await tools.call("missing", "{}")
+        return ok, invalid, wrong, failed, unknown
+
+    ok, invalid, wrong, failed, unknown = asyncio.run(main())
+    assert ok == {"status": "ok"} and store == {"a": (["x"], 1, None)}
+    assert invalid["status"] == "error" and "not valid JSON" in invalid["message"]
+    assert wrong["status"] == "error" and "array of string" in wrong["message"]
+    assert failed == {"status": "error", "message": "boom"}
+    assert unknown == {"status": "error", "message": "Unknown function: missing"}
+
+
+def test_save_memory_requires_a_list_value():
+    # the schema has always declared value as an array, a bare string is now rejected before the tool runs
+    save_memory = registry.get("save_memory")
+    assert save_memory.validate({"key": "user.name", "value": ["Alice"]}) is None
+    assert save_memory.validate({"key": "user.name", "value": "Alice"}).startswith("argument 'value' must be array of")
+    # a set cannot hold objects or arrays, they are rejected before the tool runs
+    assert save_memory.validate({"key": "user.name", "value": [{"x": 1}]}).startswith("argument 'value' must be array of string,")